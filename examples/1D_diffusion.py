@@ -17,7 +17,6 @@ from openrxn import unit
 from openrxn.systems.reporters import AllReporter, SumReporter, SelectionReporter
 from openrxn.connections import IsotropicConnection
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 # define species and reactions
@@ -48,23 +47,22 @@ sys.set_q([16,17],500)
 print("Running ODE...")
 ode_results = sys.run(240)
 
+# matplotlib is imported only after the simulations, so batch runs
+# that skip plotting do not pay its startup cost
+import matplotlib.pyplot as plt
+
 fig, ax = plt.subplots(nrows=2,ncols=2)
 ax[0][0].set_title('t=10s')
 ax[0][1].set_title('t=60s')
 ax[1][0].set_title('t=120s')
 ax[1][1].set_title('t=240s')
 
-IDs = []
-pos_x = []
-for i in range(K):
-    c_name = 'main-{0}'.format(i)
-    ID = sys.state.index[c_name]['A']
-    IDs.append(ID)
-    pos_x.append(sys.state.x_pos[ID]/1000000)  # in mm
-
-t1 = np.argwhere(ode_results.t > 10).min()
-t2 = np.argwhere(ode_results.t > 60).min()
-t3 = np.argwhere(ode_results.t > 120).min()
+IDs = sys.state.species_ids('A',array_ID='main')
+pos_x = sys.state.x_pos[IDs]/1000000  # in mm
+
+t1 = np.searchsorted(ode_results.t, 10.0, side='right')
+t2 = np.searchsorted(ode_results.t, 60.0, side='right')
+t3 = np.searchsorted(ode_results.t, 120.0, side='right')
 t4 = ode_results.y.shape[1]-1
 ax[0][0].plot(pos_x,ode_results.y[IDs,t1])
 ax[0][1].plot(pos_x,ode_results.y[IDs,t2])
@@ -83,10 +81,10 @@ for i in range(5):
     Gillespie_sys.set_q([16,17],500)
     tmp = Gillespie_sys.run(240)
     reports = Gillespie_sys.reporters[0].reports()
-    ax[0][0].plot(pos_x,reports[10]['report'])
-    ax[0][1].plot(pos_x,reports[60]['report'])
-    ax[1][0].plot(pos_x,reports[120]['report'])
-    ax[1][1].plot(pos_x,reports[239]['report'],label='run {0}'.format(i))
+    ax[0][0].plot(pos_x,reports.y[10])
+    ax[0][1].plot(pos_x,reports.y[60])
+    ax[1][0].plot(pos_x,reports.y[120])
+    ax[1][1].plot(pos_x,reports.y[239],label='run {0}'.format(i))
 
 ax[1][1].legend()
 plt.tight_layout()
@@ -25,7 +25,6 @@ from openrxn import unit
 from openrxn.systems.reporters import AllReporter, SumReporter, SelectionReporter
 from openrxn.connections import IsotropicConnection
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 d = 0.16/unit.sec
@@ -78,6 +77,9 @@ sys.set_q(np.arange(sys.state.size),0)
 
 ode_results = sys.run(1800)
 
+# import matplotlib only once the simulation is done (see 1D_diffusion.py)
+import matplotlib.pyplot as plt
+
 fig, ax = plt.subplots(nrows=1,ncols=2)
 ax[0].set_ylabel('Number of A molecules')
 ax[1].set_ylabel('Number of B molecules')
@@ -85,13 +87,8 @@ ax[0].set_xlabel('x (mm)')
 ax[1].set_xlabel('x (mm)')
 plt.show()
 
-IDs_A = []
-IDs_B = []
-pos_x = []
-for i in range(K):
-    c_name = 'main-{0}'.format(i)
-    IDs_A.append(sys.state.index[c_name]['A'])
-    IDs_B.append(sys.state.index[c_name]['B'])
+IDs_A = sys.state.species_ids('A',array_ID='main')
+IDs_B = sys.state.species_ids('B',array_ID='main')
 pos_x = sys.state.x_pos[IDs_A]/1000000  # in mm
 
 t4 = ode_results.y.shape[1]-1
@@ -107,15 +104,11 @@ for i in range(1):
     Gillespie_sys.add_reporter(AllReporter(freq=100))
     Gillespie_sys.set_q(np.arange(sys.state.size),0)
     tmp = Gillespie_sys.run(1800)
-    IDs_A = []
-    IDs_B = []
-    for j in range(K):
-        c_name = 'main-{0}'.format(j)
-        IDs_A.append(sys.state.index[c_name]['A'])
-        IDs_B.append(sys.state.index[c_name]['B'])
+    IDs_A = Gillespie_sys.state.species_ids('A',array_ID='main')
+    IDs_B = Gillespie_sys.state.species_ids('B',array_ID='main')
     reports = Gillespie_sys.reporters[0].reports()
-    ax[0].plot(pos_x,reports[-1]['report'][IDs_A],label='run {0}'.format(i))
-    ax[1].plot(pos_x,reports[-1]['report'][IDs_B],label='run {0}'.format(i))
+    ax[0].plot(pos_x,reports.y[-1,IDs_A],label='run {0}'.format(i))
+    ax[1].plot(pos_x,reports.y[-1,IDs_B],label='run {0}'.format(i))
 
 ax[0].legend()
 ax[1].legend()
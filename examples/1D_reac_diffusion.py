@@ -20,7 +20,6 @@ from openrxn import unit
 from openrxn.systems.reporters import AllReporter, SumReporter, SelectionReporter
 from openrxn.connections import IsotropicConnection
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 d = 0.16/unit.sec
@@ -58,23 +57,21 @@ sys.set_q(np.arange(sys.state.size),0)
 
 ode_results = sys.run(1800)
 
+# import matplotlib only once the simulation is done (see 1D_diffusion.py)
+import matplotlib.pyplot as plt
+
 fig, ax = plt.subplots(nrows=2,ncols=2)
 ax[0][0].set_title('t=1 min')
 ax[0][1].set_title('t=5 min')
 ax[1][0].set_title('t=10 min')
 ax[1][1].set_title('t=30 min')
 
-IDs = []
-pos_x = []
-for i in range(K):
-    c_name = 'main-{0}'.format(i)
-    ID = sys.state.index[c_name]['A']
-    IDs.append(ID)
-    pos_x.append(sys.state.x_pos[ID]/1000000)  # in mm
-
-t1 = np.argwhere(ode_results.t > 60).min()
-t2 = np.argwhere(ode_results.t > 300).min()
-t3 = np.argwhere(ode_results.t > 600).min()
+IDs = sys.state.species_ids('A',array_ID='main')
+pos_x = sys.state.x_pos[IDs]/1000000  # in mm
+
+t1 = np.searchsorted(ode_results.t, 60.0, side='right')
+t2 = np.searchsorted(ode_results.t, 300.0, side='right')
+t3 = np.searchsorted(ode_results.t, 600.0, side='right')
 t4 = ode_results.y.shape[1]-1
 ax[0][0].plot(pos_x,ode_results.y[IDs,t1])
 ax[0][1].plot(pos_x,ode_results.y[IDs,t2])
@@ -91,10 +88,10 @@ for i in range(1):
     Gillespie_sys.set_q(np.arange(sys.state.size),0)
     tmp = Gillespie_sys.run(1800)
     reports = Gillespie_sys.reporters[0].reports()
-    ax[0][0].plot(pos_x,reports[5]['report'])
-    ax[0][1].plot(pos_x,reports[29]['report'])
-    ax[1][0].plot(pos_x,reports[59]['report'])
-    ax[1][1].plot(pos_x,reports[179]['report'],label='run {0}'.format(i))
+    ax[0][0].plot(pos_x,reports.y[5])
+    ax[0][1].plot(pos_x,reports.y[29])
+    ax[1][0].plot(pos_x,reports.y[59])
+    ax[1][1].plot(pos_x,reports.y[179],label='run {0}'.format(i))
 
 ax[1][1].legend()
 plt.show()
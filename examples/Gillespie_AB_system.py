@@ -13,7 +13,6 @@ from openrxn.model import Model
 from openrxn.compartments.compartment import Compartment
 from openrxn import unit
 from openrxn.systems.reporters import AllReporter, SumReporter, SelectionReporter
-import matplotlib.pyplot as plt
 
 # define species and reactions
 A = Species('A')
@@ -45,6 +44,9 @@ sys = ODESystem(flat_model)
 sys.set_q([0,1,2,3],0)
 ode_results = sys.run(100)
 
+# import matplotlib only once the simulation is done (see 1D_diffusion.py)
+import matplotlib.pyplot as plt
+
 fig, ax = plt.subplots(nrows=1,ncols=2)
 
 A_idx = sys.state.index['main']['A']
@@ -62,13 +64,10 @@ for i in range(5):
     Gillespie_sys.set_q([0,1,2,3],0)
     tmp = Gillespie_sys.run(100)
     reports = Gillespie_sys.reporters[0].reports()
-    t = [r['t'] for r in reports]
     A_idx = Gillespie_sys.state.index['main']['A']
     B_idx = Gillespie_sys.state.index['main']['B']
-    A = [r['report'][A_idx] for r in reports]
-    B = [r['report'][B_idx] for r in reports]
-    ax[0].plot(t,A,label='run {0}'.format(i))
-    ax[1].plot(t,B,label='run {0}'.format(i))
+    ax[0].plot(reports.t,reports.y[:,A_idx],label='run {0}'.format(i))
+    ax[1].plot(reports.t,reports.y[:,B_idx],label='run {0}'.format(i))
 
 # this result should look like Figure 2.1 of Erban et al
 
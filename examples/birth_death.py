@@ -14,7 +14,6 @@ from openrxn.model import Model
 from openrxn.compartments.compartment import Compartment
 from openrxn import unit
 from openrxn.systems.reporters import AllReporter, SumReporter, SelectionReporter
-import matplotlib.pyplot as plt
 
 # define species and reactions
 A = Species('A')
@@ -34,6 +33,10 @@ sys = ODESystem(flat_model)
 # set initial concentrations
 sys.set_q([0],0)
 ode_results = sys.run(100)
+
+# import matplotlib only once the simulation is done (see 1D_diffusion.py)
+import matplotlib.pyplot as plt
+
 plt.plot(ode_results.t,ode_results.y[0],label='ODE')
 
 #----
@@ -46,9 +49,7 @@ for i in range(10):
     Gillespie_sys.set_q([0],0)
     tmp = Gillespie_sys.run(100)
     reports = Gillespie_sys.reporters[0].reports()
-    t = [r['t'] for r in reports]
-    y = [r['report'] for r in reports]
-    plt.plot(t,y,label='run {0}'.format(i))
+    plt.plot(reports.t,reports.y,label='run {0}'.format(i))
 
 # this result should look like Figure 2.1 of Erban et al
 plt.show()
@@ -39,6 +39,7 @@ setup(
     install_requires=[
         'numpy',
         'scipy',
+        'numba',
         'networkx',
         'pint',
         'pandas',
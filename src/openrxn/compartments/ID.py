@@ -1,16 +1,18 @@
 
 def join_tup(tup):
-    return '_'.join([str(a) for a in tup])
+    return '_'.join(map(str,tup))
 
 def makeID(array_ID,comp_ID):
     if array_ID is not None:
         tag = array_ID + '-'
     else:
         tag = ""
-        
-    if type(comp_ID) is tuple or type(comp_ID) is list:
+
+    # tuple IDs (array compartments) are the common case
+    t = type(comp_ID)
+    if t is tuple or t is list:
         return tag + join_tup(comp_ID)
-    elif type(comp_ID) is str:
+    elif t is str:
         return tag + comp_ID
-    elif type(comp_ID) is int:
+    elif t is int:
         return tag + str(comp_ID)
@@ -3,6 +3,122 @@ it easier to connect and manipulate large groups."""
 
 from openrxn.connections import Connection
 from openrxn.compartments.compartment import Compartment1D, Compartment2D, Compartment3D
+from openrxn import unit
+
+import numpy as np
+from numba import njit
+
+# kept serial on purpose: parallel=True spins up numba's threading
+# layer, which deadlocks in fork()ed workers (e.g. ensemble_run with
+# a ProcessPoolExecutor), and the loop is already memory-bound
+@njit(cache=True)
+def _build_edges(nx,ny,nz,px,py,pz):
+    """Enumerates the neighbor pairs of an nx*ny*nz grid as two
+    int32 arrays of row-major flat indices (src, dst), one pair per
+    edge.  Periodic axes (px/py/pz) wrap through a modulo in the
+    same pass as the interior edges, so the grid is walked exactly
+    once with no separate boundary loops.  Pure integer arithmetic,
+    compiled with numba."""
+
+    # edges per line along each axis: n-1 interior, plus the wrap
+    # edge when periodic (suppressed for n == 1, where the wrap
+    # would be a self-edge)
+    ex_n = nx if (px and nx > 1) else nx-1
+    ey_n = ny if (py and ny > 1) else ny-1
+    ez_n = nz if (pz and nz > 1) else nz-1
+    E = ex_n*ny*nz + nx*ey_n*nz + nx*ny*ez_n
+    src = np.empty(E,dtype=np.int32)
+    dst = np.empty(E,dtype=np.int32)
+
+    e = 0
+    for i in range(nx):
+        i1 = (i+1) % nx if px else i+1
+        for j in range(ny):
+            j1 = (j+1) % ny if py else j+1
+            for k in range(nz):
+                k1 = (k+1) % nz if pz else k+1
+                flat = (i*ny+j)*nz+k
+                if i1 < nx and i1 != i:
+                    src[e] = flat
+                    dst[e] = (i1*ny+j)*nz+k
+                    e += 1
+                if j1 < ny and j1 != j:
+                    src[e] = flat
+                    dst[e] = (i*ny+j1)*nz+k
+                    e += 1
+                if k1 < nz and k1 != k:
+                    src[e] = flat
+                    dst[e] = (i*ny+j)*nz+k1
+                    e += 1
+
+    return src, dst
+
+class CompartmentList(object):
+    """Contiguous flat storage for the compartments of an array.
+
+    Compartments are kept in a plain Python list in C (row-major)
+    order, so grid lookups compute a flat index instead of hashing an
+    (i,j,k) tuple.  A small dict-like surface (keys/values/items and
+    tuple indexing) is kept so existing code that treated
+    array.compartments as a dict keyed by grid tuples works
+    unchanged.
+
+    An optional tilemap (a flat int array mapping row-major index to
+    storage slot) lets the owning array choose a different storage
+    order, e.g. cache-friendly tile order; tuple indexing is remapped
+    through the table transparently."""
+
+    def __init__(self, shape, tilemap=None):
+        if not isinstance(shape,tuple):
+            shape = (shape,)
+        self.shape = shape
+        n = 1
+        for s in shape:
+            n *= s
+        self._list = [None]*n
+        self.tilemap = tilemap
+        if tilemap is not None:
+            # storage slot -> row-major index, for enumerating keys
+            # in storage order
+            self._order = np.argsort(tilemap)
+
+    def _idx(self, key):
+        # 1D arrays use bare integer keys, higher dimensions tuples
+        if isinstance(key,tuple):
+            flat = 0
+            for k,n in zip(key,self.shape):
+                flat = flat*n + k
+        else:
+            flat = key
+        if self.tilemap is not None:
+            return self.tilemap[flat]
+        return flat
+
+    def __getitem__(self, key):
+        return self._list[self._idx(key)]
+
+    def __setitem__(self, key, value):
+        self._list[self._idx(key)] = value
+
+    def __len__(self):
+        return len(self._list)
+
+    def __contains__(self, key):
+        return self._list[self._idx(key)] is not None
+
+    def keys(self):
+        if len(self.shape) == 1:
+            return range(self.shape[0])
+        if self.tilemap is not None:
+            ijk = np.unravel_index(self._order,self.shape)
+            return (tuple(int(x[s]) for x in ijk) for s in range(len(self._list)))
+        return np.ndindex(self.shape)
+
+    def values(self):
+        return self._list
+
+    def items(self):
+        return zip(self.keys(),self._list)
 
 class CompartmentArray(object):
     """Base class for compartment arrays."""
@@ -11,45 +127,207 @@ class CompartmentArray(object):
         """Returns a graph, with compartments as nodes and
         connections as edges."""
 
+    def build_csr_graph(self):
+        """Builds a CSR (compressed sparse row) int32 view of the
+        connection graph and stores it on the array:
+
+        nbr_indptr : int32[N+1]
+        edge range of compartment slot i is
+        nbr_indptr[i]:nbr_indptr[i+1]
+
+        nbr_index :  int32[E]
+        storage slot of the neighbor (-1 for neighbors outside this
+        array)
+
+        nbr_ctype :  int32[E]
+        index into self.conn_table, the list of distinct Connection
+        instances
+
+        nbr_kind :   int8[E]
+        the ConnKind tag of the edge's connection, for integer
+        dispatch on the connection class
+
+        nbr_array :  int32[E]
+        index into self.nbr_array_table, the list of distinct
+        neighbor array IDs
+
+        The arrays are a snapshot of the dicts at call time; callers
+        that modify connections afterwards should rebuild.  Returns
+        (nbr_indptr, nbr_index, nbr_ctype, nbr_array)."""
+
+        comps = self.compartments.values()
+        slot = {id(c): s for s,c in enumerate(comps)}
+
+        self.conn_table = []
+        self.nbr_array_table = []
+        conn_idx = {}
+        arr_idx = {}
+
+        indptr = [0]
+        index = []
+        ctype = []
+        kind = []
+        nbr_arr = []
+        self._edge_nbr = []
+        for c in comps:
+            for n,ct in c.connections.values():
+                self._edge_nbr.append(n)
+                index.append(slot.get(id(n),-1))
+                ci = conn_idx.get(id(ct))
+                if ci is None:
+                    ci = len(self.conn_table)
+                    conn_idx[id(ct)] = ci
+                    self.conn_table.append(ct)
+                ctype.append(ci)
+                kind.append(int(ct.kind))
+                ai = arr_idx.get(n.array_ID)
+                if ai is None:
+                    ai = len(self.nbr_array_table)
+                    arr_idx[n.array_ID] = ai
+                    self.nbr_array_table.append(n.array_ID)
+                nbr_arr.append(ai)
+            indptr.append(len(index))
+
+        self.nbr_indptr = np.array(indptr,dtype=np.int32)
+        self.nbr_index = np.array(index,dtype=np.int32)
+        self.nbr_ctype = np.array(ctype,dtype=np.int32)
+        self.nbr_kind = np.array(kind,dtype=np.int8)
+        self.nbr_array = np.array(nbr_arr,dtype=np.int32)
+
+        return self.nbr_indptr, self.nbr_index, self.nbr_ctype, self.nbr_array
+
+    def _wire_from_edges(self, src, dst, keys, conn_type):
+        """Builds each compartment's connections dict in one shot
+        from the construction-time edge list.  The dict is created
+        with dict.fromkeys, presized to the compartment's final
+        neighbor count, so it is never resized during the inserts
+        (per-connect() insertion grows the dict through CPython's
+        2/6/12-slot resize ladder, once per compartment)."""
+
+        nbrs = [[] for f in range(self.n_compartments)]
+        for s,d in zip(src,dst):
+            nbrs[s].append(d)
+            nbrs[d].append(s)
+
+        for f in range(self.n_compartments):
+            c = self.compartments[keys[f]]
+            nbr_comps = [self.compartments[keys[x]] for x in nbrs[f]]
+            c.connections = dict.fromkeys([nc.tag for nc in nbr_comps])
+            for nc in nbr_comps:
+                c.connections[nc.tag] = (nc,conn_type)
+
+    def _init_csr_from_edges(self, src, dst):
+        """Initializes the CSR connection view (see build_csr_graph)
+        directly from the construction-time edge list, while every
+        edge still carries the array's single intra conn_type.  The
+        conn_type is stored once in conn_table and each edge refers
+        to it through an index that defaults to 0, so the snapshot
+        costs a few numpy passes instead of a Python walk over the
+        connection dicts."""
+
+        n = self.n_compartments
+        # edges are stored one-directional; the CSR view lists both
+        # directions, in storage-slot numbering
+        if getattr(self,'tilemap',None) is not None:
+            e_src = self.tilemap[np.concatenate((src,dst))]
+            e_dst = self.tilemap[np.concatenate((dst,src))]
+        else:
+            e_src = np.concatenate((src,dst))
+            e_dst = np.concatenate((dst,src))
+        # drop duplicate pairs (a periodic axis of length 2 produces
+        # one), matching the dicts where a repeated connect overwrites
+        key = np.unique(e_src.astype(np.int64)*n + e_dst)
+        e_src = key//n
+        e_dst = key%n
+
+        counts = np.bincount(e_src,minlength=n)
+        self.nbr_indptr = np.concatenate(([0],np.cumsum(counts))).astype(np.int32)
+        self.nbr_index = e_dst.astype(np.int32)
+        self.nbr_ctype = np.zeros(len(e_src),dtype=np.int32)
+        self.nbr_kind = np.full(len(e_src),int(self.conn_type.kind),dtype=np.int8)
+        self.nbr_array = np.zeros(len(e_src),dtype=np.int32)
+        self.conn_table = [self.conn_type]
+        self.nbr_array_table = [self.array_ID]
+        comps = self.compartments.values()
+        self._edge_nbr = [comps[s] for s in self.nbr_index]
+
+    def copy(self, array_ID=None):
+        """Returns a copy of this array with the same geometry and
+        intra-array connections.  The compartments are rebuilt from
+        the stored construction arguments (the geometry arrays are
+        recomputed vectorized, which is as cheap as block-copying
+        them) and each compartment's reactions are carried over.
+
+        Connections to other arrays (made with stack or join3D) are
+        not copied."""
+
+        if array_ID is None:
+            array_ID = self.array_ID
+        new = self._rebuild(array_ID)
+        new.global_rxns = self.global_rxns.copy()
+        new._global_rxn_ids = self._global_rxn_ids.copy()
+        for key,c in self.compartments.items():
+            nc = new.compartments[key]
+            nc.reactions = c.reactions.copy()
+            nc._rxn_ids = c._rxn_ids.copy()
+        return new
+
     def add_rxn_to_array(self, rxn):
-        """Adds a reaction to each compartment in the array."""
-        for c in self.compartments.values():
-            c.add_rxn_to_compartment(rxn)
+        """Adds a reaction to every compartment in the array.
+
+        The reaction is recorded once on the array itself rather
+        than appended to each compartment's list, so the attach is
+        O(1); compartments merge it in through their
+        effective_reactions property."""
+        if rxn.ID not in self._global_rxn_ids:
+            self.global_rxns.append(rxn)
+            self._global_rxn_ids.add(rxn.ID)
 
     def add_rxns_to_array(self, rxns):
-        """Adds each reaction in rxns to each compartment in the array."""
+        """Adds each reaction in rxns to every compartment in the
+        array (see add_rxn_to_array)."""
         for r in rxns:
             self.add_rxn_to_array(r)
 
     def change_all_intra_connection_type(self, new_ctype):
         """Change the connection type between the compartments,
-        overwriting them with new_ctype, which must be a Connection 
-        type. 
+        overwriting them with new_ctype, which must be a Connection
+        type.
 
         This only affects connections within the array,
         not connections between arrays."""
 
-        for c in self.compartments.values():
-            for n,c_type in c.connections.values():
-
-                # check if both compartments are in same array
-                if n.array_ID == self.array_ID:
-                    c.connect(n,new_ctype,warn_overwrite=False)    
+        self._change_conn_types(self.array_ID,new_ctype)
 
     def change_all_inter_connection_type(self, other_array, new_ctype):
         """Change the connection type between the compartments in this
-        array and those in "other_array", overwriting them with 
-        new_ctype, which must be a Connection type. 
+        array and those in "other_array", overwriting them with
+        new_ctype, which must be a Connection type.
 
         This only affects connections between the arrays,
         not connections within arrays."""
 
-        for c in self.compartments.values():
-            for n,c_type in c.connections.values():
+        self._change_conn_types(other_array.array_ID,new_ctype)
+
+    def _change_conn_types(self, target_array_ID, new_ctype):
+        """Overwrite the connection type of every edge whose
+        neighbor lives in target_array_ID.  The edges are selected
+        with one vectorized mask over the CSR graph, so only the
+        matching edges are touched in Python (to update the
+        authoritative dicts)."""
 
-                # check if other compartment is in other_array
-                if n.array_ID == other_array.array_ID:
-                    c.connect(n,new_ctype,warn_overwrite=False)    
+        self.build_csr_graph()
+        if target_array_ID not in self.nbr_array_table:
+            return
+        mask = self.nbr_array == self.nbr_array_table.index(target_array_ID)
+
+        comps = self.compartments.values()
+        edge_src = np.repeat(np.arange(len(comps)),np.diff(self.nbr_indptr))
+        for e in np.flatnonzero(mask):
+            comps[edge_src[e]].connect(self._edge_nbr[e],new_ctype,warn_overwrite=False)
+
+        self.nbr_ctype[mask] = len(self.conn_table)
+        self.conn_table.append(new_ctype)
 
                     
 class CompartmentArray1D(CompartmentArray):
@@ -69,26 +347,48 @@ class CompartmentArray1D(CompartmentArray):
         self.array_ID = array_ID
         self.box_len = [positions[-1]-positions[0]]
         self.periodic = periodic
-        
+        self.positions = positions
+        self.conn_type = conn_type
+        # reactions attached array-wide (see add_rxn_to_array)
+        self.global_rxns = []
+        self._global_rxn_ids = set()
+
         assert isinstance(conn_type,Connection), "conn_type must be of type Connection"
 
         # set number of compartments
         self.n_compartments = len(positions)-1
 
-        # initialize compartment dictionary
-        self.compartments = {}
+        # SoA geometry arrays: cell bounds and volumes are held as
+        # plain float64 arrays (in nm) on the array object and
+        # computed vectorized; each compartment's volume quantity is
+        # assigned from the shared array instead of being recomputed
+        # with pint arithmetic per cell
+        pm = positions.to(unit.nm).magnitude
+        self.x_lo = pm[:-1]
+        self.x_hi = pm[1:]
+        self.volumes = self.x_hi - self.x_lo
+        vol_q = self.volumes*unit.nm
+
+        # initialize compartment storage; the pint bound tuples are
+        # built once per cell edge instead of re-indexing the
+        # positions Quantity inside the loop
+        bounds = [(positions[i],positions[i+1]) for i in range(self.n_compartments)]
+        self.compartments = CompartmentList(self.n_compartments)
         for i in range(len(positions)-1):
-            self.compartments[(i)] = Compartment1D((i), pos=[(positions[i],positions[i+1])], array_ID=self.array_ID)
+            self.compartments[(i)] = Compartment1D((i), pos=[bounds[i]], array_ID=self.array_ID, volume=vol_q[i])
+            self.compartments[(i)]._array = self
 
         # add connections
-        for i in range(self.n_compartments):
-            if i > 0:
-                self.compartments[(i)].connect(self.compartments[(i-1)],conn_type)
-            if i < self.n_compartments-1:
-                self.compartments[(i)].connect(self.compartments[(i+1)],conn_type)
+        src = np.arange(self.n_compartments-1,dtype=np.int32)
+        dst = src+1
         if periodic:
-            self.compartments[(0)].connect(self.compartments[(self.n_compartments-1)],conn_type)
-            self.compartments[(self.n_compartments-1)].connect(self.compartments[(0)],conn_type)
+            src = np.append(src,0).astype(np.int32)
+            dst = np.append(dst,self.n_compartments-1).astype(np.int32)
+        self._wire_from_edges(src,dst,range(self.n_compartments),conn_type)
+        self._init_csr_from_edges(src,dst)
+
+    def _rebuild(self, array_ID):
+        return CompartmentArray1D(array_ID,self.positions,self.conn_type,periodic=self.periodic)
 
     def stack(self,other_array,conn_type):
         """Stacks another 1D compartment array on top of this
@@ -142,41 +442,45 @@ class CompartmentArray2D(CompartmentArray):
         self.y_pos = y_pos
         self.box_len = [x_pos[-1]-x_pos[0],y_pos[-1]-y_pos[0]]
         self.periodic = periodic
-
-        # initialize compartment dictionary
-        self.compartments = {}
-        for i in range(self.nx-1):
-            posx = (x_pos[i],x_pos[i+1])
-            for j in range(self.ny-1):
-                posy = (y_pos[j],y_pos[j+1])
-                self.compartments[(i,j)] = Compartment2D((i,j), pos=[posx,posy], array_ID=self.array_ID)
-
-        # add connections
+        self.conn_type = conn_type
+        # reactions attached array-wide (see add_rxn_to_array)
+        self.global_rxns = []
+        self._global_rxn_ids = set()
+
+        # SoA geometry arrays (see CompartmentArray1D)
+        xm = x_pos.to(unit.nm).magnitude
+        ym = y_pos.to(unit.nm).magnitude
+        self.x_lo = np.repeat(xm[:-1],self.ny)
+        self.x_hi = np.repeat(xm[1:],self.ny)
+        self.y_lo = np.tile(ym[:-1],self.nx)
+        self.y_hi = np.tile(ym[1:],self.nx)
+        self.volumes = np.multiply.outer(np.diff(xm),np.diff(ym)).ravel()
+        vol_q = self.volumes*unit.nm**2
+
+        # initialize compartment storage; per-axis bound tuples are
+        # built once instead of re-indexing the position Quantities
+        # for every cell
+        x_bounds = [(x_pos[i],x_pos[i+1]) for i in range(self.nx)]
+        y_bounds = [(y_pos[j],y_pos[j+1]) for j in range(self.ny)]
+        self.compartments = CompartmentList((self.nx,self.ny))
         for i in range(self.nx):
+            posx = x_bounds[i]
             for j in range(self.ny):
-                if i > 0:
-                    # make connection to the left
-                    self.compartments[(i,j)].connect(self.compartments[(i-1,j)],conn_type)
-                if i < self.nx-1:
-                    # make connection to the right
-                    self.compartments[(i,j)].connect(self.compartments[(i+1,j)],conn_type)
-                if j > 0:
-                    # make connection to the bottom
-                    self.compartments[(i,j)].connect(self.compartments[(i,j-1)],conn_type)
-                if j < self.ny-1:
-                    # make connection to the top
-                    self.compartments[(i,j)].connect(self.compartments[(i,j+1)],conn_type)
-
-        if periodic[0]:
-            for j in range(self.ny):
-                self.compartments[(0,j)].connect(self.compartments[(self.nx-1,j)],conn_type)
-                self.compartments[(self.nx-1,j)].connect(self.compartments[(0,j)],conn_type)
+                self.compartments[(i,j)] = Compartment2D((i,j), pos=[posx,y_bounds[j]], array_ID=self.array_ID, volume=vol_q[i*self.ny+j])
+                self.compartments[(i,j)]._array = self
+
+        # add connections: the compiled kernel enumerates all
+        # neighbor pairs (including periodic wrap-arounds) as flat
+        # index arrays, then each compartment's dict is built in one
+        # preallocated shot
+        src,dst = _build_edges(self.nx,self.ny,1,periodic[0],periodic[1],False)
+        keys = list(np.ndindex(self.nx,self.ny))
+        self._wire_from_edges(src,dst,keys,conn_type)
+        self._init_csr_from_edges(src,dst)
+
+    def _rebuild(self, array_ID):
+        return CompartmentArray2D(array_ID,self.x_pos,self.y_pos,self.conn_type,periodic=self.periodic)
 
-        if periodic[1]:
-            for i in range(self.nx):
-                self.compartments[(i,0)].connect(self.compartments[(i,self.ny-1)],conn_type)
-                self.compartments[(i,self.ny-1)].connect(self.compartments[(i,0)],conn_type)
-        
     def stack(self,other_array,conn_type):
         """Stacks another 2D compartment array on top of this
         one, making connections between the two groups
@@ -238,63 +542,102 @@ class CompartmentArray3D(CompartmentArray):
         self.z_pos = z_pos
         self.box_len = [x_pos[-1]-x_pos[0],y_pos[-1]-y_pos[0],z_pos[-1]-z_pos[0]]
         self.periodic = periodic
-
-        # initialize compartment dictionary
-        self.compartments = {}
-        for i in range(len(x_pos)-1):
-            lx = x_pos[i+1]-x_pos[i]
-            posx = (x_pos[i],x_pos[i+1])
-            for j in range(len(y_pos)-1):
-                ly = y_pos[j+1]-y_pos[j]
-                posy = (y_pos[j],y_pos[j+1])
-                for k in range(len(z_pos)-1):
-                    lz = z_pos[k+1]-z_pos[k]
-                    posz = (z_pos[k],z_pos[k+1])
-                    sa = {'xy' : lx*ly, 'yz' : ly*lz, 'xz' : lx*lz}
-                    self.compartments[(i,j,k)] = Compartment3D((i,j,k),
-                                                             pos=[posx,posy,posz],
-                                                             array_ID=self.array_ID,
-                                                             surface_area=sa)
-        # add connections
-        for i in range(self.nx):
-            for j in range(self.ny):
-                for k in range(self.nz):
-                    if i > 0:
-                        # make connection to the left
-                        self.compartments[(i,j,k)].connect(self.compartments[(i-1,j,k)],conn_type)
-                    if i < self.nx-1:
-                        # make connection to the right
-                        self.compartments[(i,j,k)].connect(self.compartments[(i+1,j,k)],conn_type)
-                    if j > 0:
-                        # make connection to the bottom
-                        self.compartments[(i,j,k)].connect(self.compartments[(i,j-1,k)],conn_type)
-                    if j < self.ny-1:
-                        # make connection to the top
-                        self.compartments[(i,j,k)].connect(self.compartments[(i,j+1,k)],conn_type)
-                    if k > 0:
-                        # make connection to the bottom
-                        self.compartments[(i,j,k)].connect(self.compartments[(i,j,k-1)],conn_type)
-                    if k < self.nz-1:
-                        # make connection to the top
-                        self.compartments[(i,j,k)].connect(self.compartments[(i,j,k+1)],conn_type)
-
-        if periodic[0]:
-            for j in range(self.ny):
-                for k in range(self.nz):
-                    self.compartments[(0,j,k)].connect(self.compartments[(self.nx-1,j,k)],conn_type)
-                    self.compartments[(self.nx-1,j,k)].connect(self.compartments[(0,j,k)],conn_type)
-
-        if periodic[1]:
-            for i in range(self.nx):
-                for k in range(self.nz):
-                    self.compartments[(i,0,k)].connect(self.compartments[(i,self.ny-1,k)],conn_type)
-                    self.compartments[(i,self.ny-1,k)].connect(self.compartments[(i,0,k)],conn_type)
-
-        if periodic[2]:
-            for i in range(self.nx):
-                for j in range(self.ny):
-                    self.compartments[(i,j,0)].connect(self.compartments[(i,j,self.nz-1)],conn_type)
-                    self.compartments[(i,j,self.nz-1)].connect(self.compartments[(i,j,0)],conn_type)
+        self.conn_type = conn_type
+        # reactions attached array-wide (see add_rxn_to_array)
+        self.global_rxns = []
+        self._global_rxn_ids = set()
+
+        # precompute all cell edge lengths and face areas at once;
+        # the per-cell arithmetic then happens in numpy instead of
+        # once per compartment
+        lx = np.diff(x_pos)
+        ly = np.diff(y_pos)
+        lz = np.diff(z_pos)
+        sa_xy = np.multiply.outer(lx.magnitude,ly.magnitude)*lx.units*ly.units
+        sa_yz = np.multiply.outer(ly.magnitude,lz.magnitude)*ly.units*lz.units
+        sa_xz = np.multiply.outer(lx.magnitude,lz.magnitude)*lx.units*lz.units
+
+        # assign storage slots in TILE^3 blocks (row-major within
+        # each block) rather than plain row-major order, so that
+        # spatial neighbors tend to sit near each other in the flat
+        # storage; tilemap maps row-major index -> storage slot
+        TILE = 8
+        ii,jj,kk = np.indices((self.nx,self.ny,self.nz))
+        nty = -(-self.ny//TILE)
+        ntz = -(-self.nz//TILE)
+        tile_id = ((ii//TILE)*nty + jj//TILE)*ntz + kk//TILE
+        order = np.argsort(tile_id.ravel(),kind='stable')
+        self.tilemap = np.empty(self.n_compartments,dtype=np.int32)
+        self.tilemap[order] = np.arange(self.n_compartments,dtype=np.int32)
+
+        # SoA geometry arrays (see CompartmentArray1D), permuted
+        # into storage order
+        xm = x_pos.to(unit.nm).magnitude
+        ym = y_pos.to(unit.nm).magnitude
+        zm = z_pos.to(unit.nm).magnitude
+        self.x_lo = np.repeat(xm[:-1],self.ny*self.nz)[order]
+        self.x_hi = np.repeat(xm[1:],self.ny*self.nz)[order]
+        self.y_lo = np.tile(np.repeat(ym[:-1],self.nz),self.nx)[order]
+        self.y_hi = np.tile(np.repeat(ym[1:],self.nz),self.nx)[order]
+        self.z_lo = np.tile(zm[:-1],self.nx*self.ny)[order]
+        self.z_hi = np.tile(zm[1:],self.nx*self.ny)[order]
+        self.volumes = np.multiply.outer(np.multiply.outer(np.diff(xm),np.diff(ym)),np.diff(zm)).ravel()[order]
+        vol_q = self.volumes*unit.nm**3
+
+        # initialize compartment storage, walking the cells in
+        # storage order; per-axis bound tuples are built once instead
+        # of re-indexing the position Quantities for every cell
+        x_bounds = [(x_pos[i],x_pos[i+1]) for i in range(self.nx)]
+        y_bounds = [(y_pos[j],y_pos[j+1]) for j in range(self.ny)]
+        z_bounds = [(z_pos[k],z_pos[k+1]) for k in range(self.nz)]
+        self.compartments = CompartmentList((self.nx,self.ny,self.nz),tilemap=self.tilemap)
+        cell_i,cell_j,cell_k = np.unravel_index(order,(self.nx,self.ny,self.nz))
+        for slot in range(self.n_compartments):
+            i = int(cell_i[slot])
+            j = int(cell_j[slot])
+            k = int(cell_k[slot])
+            sa = {'xy' : sa_xy[i,j], 'yz' : sa_yz[j,k], 'xz' : sa_xz[i,k]}
+            self.compartments[(i,j,k)] = Compartment3D((i,j,k),
+                                                     pos=[x_bounds[i],
+                                                          y_bounds[j],
+                                                          z_bounds[k]],
+                                                     array_ID=self.array_ID,
+                                                     surface_area=sa,
+                                                     volume=vol_q[slot])
+            self.compartments[(i,j,k)]._array = self
+        # add connections: the compiled kernel enumerates all
+        # neighbor pairs (including periodic wrap-arounds) as flat
+        # index arrays, then each compartment's dict is built in one
+        # preallocated shot
+        src,dst = _build_edges(self.nx,self.ny,self.nz,
+                               periodic[0],periodic[1],periodic[2])
+        keys = list(np.ndindex(self.nx,self.ny,self.nz))
+        self._wire_from_edges(src,dst,keys,conn_type)
+        self._init_csr_from_edges(src,dst)
+
+        # spatial index: cell_index[i,j,k] gives the storage slot of
+        # grid cell (i,j,k), and cell_of maps a point to its cell.
+        # Together with the x/y/z_pos bin edges this is the hook for
+        # radius-based neighbor queries (bucket points by cell, then
+        # scan only nearby cells instead of all N^2 pairs)
+        self.cell_index = self.tilemap.reshape(self.nx,self.ny,self.nz)
+
+    def cell_of(self,x,y,z):
+        """Returns the (i,j,k) grid cell containing the point
+        (x,y,z), given as quantities with length units.  Points on a
+        cell boundary belong to the cell above it; points outside the
+        box are clipped to the boundary cells."""
+
+        i = np.searchsorted(self.x_pos.to(unit.nm).magnitude,x.to(unit.nm).magnitude,side='right')-1
+        j = np.searchsorted(self.y_pos.to(unit.nm).magnitude,y.to(unit.nm).magnitude,side='right')-1
+        k = np.searchsorted(self.z_pos.to(unit.nm).magnitude,z.to(unit.nm).magnitude,side='right')-1
+
+        return (int(np.clip(i,0,self.nx-1)),
+                int(np.clip(j,0,self.ny-1)),
+                int(np.clip(k,0,self.nz-1)))
+
+    def _rebuild(self, array_ID):
+        return CompartmentArray3D(array_ID,self.x_pos,self.y_pos,self.z_pos,self.conn_type,periodic=self.periodic)
 
     def join3D(self,other_array,conn_type,append_side=None):
         """Joins a 3D compartment array to this
@@ -317,55 +660,31 @@ class CompartmentArray3D(CompartmentArray):
 
         assert append_side in ['x-','x+','y-','y+','z-','z+'], "append_side must be set to one of [x-,x+,y-,y+,z-,z+]"
 
-        if append_side[0] == 'x':
-            face1 = (self.ny,self.nz)
-            face2 = (other_array.ny,other_array.nz)
-        elif append_side[0] == 'y':
-            face1 = (self.nx,self.nz)
-            face2 = (other_array.nx,other_array.nz)
-        elif append_side[0] == 'z':
-            face1 = (self.nx,self.ny)
-            face2 = (other_array.nx,other_array.ny)
+        # parameterize the face: the same walk works for all six
+        # sides once the joined axis and the two fixed indices along
+        # it are known
+        axis = 'xyz'.index(append_side[0])
+        shape1 = (self.nx,self.ny,self.nz)
+        shape2 = (other_array.nx,other_array.ny,other_array.nz)
+        face1 = tuple(n for a,n in enumerate(shape1) if a != axis)
+        face2 = tuple(n for a,n in enumerate(shape2) if a != axis)
 
         if face1 != face2:
             raise ValueError("Error! dimensions of arrays don't match along append dimensions: {0} {1}".format(face1,face2))
 
         assert isinstance(conn_type, Connection), "conn_type must be of type Connection"
 
+        if append_side[1] == '-':
+            ind1 = 0
+            ind2 = shape2[axis]-1
+        else:
+            ind1 = shape1[axis]-1
+            ind2 = 0
+
         # add connections between compartments
-        if append_side[0] == 'x':
-            if append_side[1] == '-':
-                xind1 = 0
-                xind2 = other_array.nx-1
-            else:
-                xind1 = self.nx-1
-                xind2 = 0
-            for j in range(self.ny):
-                for k in range(self.nz):
-                    self.compartments[(xind1,j,k)].connect(other_array.compartments[(xind2,j,k)],conn_type)
-                    other_array.compartments[(xind2,j,k)].connect(self.compartments[(xind1,j,k)],conn_type)
-        elif append_side[0] == 'y':
-            if append_side[1] == '-':
-                yind1 = 0
-                yind2 = other_array.ny-1
-            else:
-                yind1 = self.ny-1
-                yind2 = 0
-            for i in range(self.nx):
-                for k in range(self.nz):
-                    self.compartments[(i,yind1,k)].connect(other_array.compartments[(i,yind2,k)],conn_type)
-                    other_array.compartments[(i,yind2,k)].connect(self.compartments[(i,yind1,k)],conn_type)
-        elif append_side[0] == 'z':
-            if append_side[1] == '-':
-                zind1 = 0
-                zind2 = other_array.nz-1
-            else:
-                zind1 = self.nz-1
-                zind2 = 0
-            for i in range(self.nx):
-                for j in range(self.ny):
-                    self.compartments[(i,j,zind1)].connect(other_array.compartments[(i,j,zind2)],conn_type)
-                    other_array.compartments[(i,j,zind2)].connect(self.compartments[(i,j,zind1)],conn_type)
+        for face_idx in np.ndindex(face1):
+            key1 = face_idx[:axis] + (ind1,) + face_idx[axis:]
+            key2 = face_idx[:axis] + (ind2,) + face_idx[axis:]
+            self.compartments[key1].connect(other_array.compartments[key2],conn_type)
+            other_array.compartments[key2].connect(self.compartments[key1],conn_type)
 
-        
-        
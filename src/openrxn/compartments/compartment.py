@@ -3,6 +3,8 @@ of material between compartments through connections."""
 
 from openrxn.compartments.ID import makeID
 from openrxn import unit
+
+import numpy as np
 import logging
 
 class Compartment(object):
@@ -21,96 +23,203 @@ class Compartment(object):
 
     Upon initialization, both of these lists are empty.
     """
-    
+
+    # compartments are the most numerous objects in a model; slots
+    # drop the per-instance dict, which matters for large 3D grids
+    __slots__ = ('ID','reactions','_rxn_ids','connections','pos',
+                 'array_ID','volume','_array','_neighbor_idx',
+                 '_conn_type_idx','_conn_table','tag')
+
     def __init__(self, ID, pos=[], array_ID=None, volume=None):
         self.ID = ID
         self.reactions = []
+        self._rxn_ids = set()
         self.connections = {}
         self.pos = pos
         self.array_ID = array_ID
         self.volume = volume
-        
+        # back-reference to the owning CompartmentArray, set by the
+        # array constructors; used to merge in array-wide reactions
+        self._array = None
+        # SoA neighbor view, built by finalize_neighbors
+        self._neighbor_idx = None
+        # the connection tag is a pure function of (array_ID, ID),
+        # neither of which changes after construction, so build it
+        # once here instead of on every connect/remove call
+        self.tag = makeID(array_ID,ID)
+
+    def __repr__(self):
+        # constant-time on purpose: reprs show up in logs and
+        # tracebacks, so no walking of the reaction list
+        return "{0}(ID={1!r}, {2} reactions, {3} connections)".format(
+            type(self).__name__,self.ID,len(self.reactions),len(self.connections))
+
     def add_rxn_to_compartment(self, rxn):
         """Adds a reaction to a compartment."""
-        if rxn.ID in [r.ID for r in self.reactions]:
+        if rxn.ID in self._rxn_ids:
             logging.warn("Reaction {0} already in compartment {1}".format(rxn.ID,self.ID))
         else:
             self.reactions.append(rxn)
+            self._rxn_ids.add(rxn.ID)
 
     def add_rxns_to_compartment(self, rxns):
-        """Adds a list of reactions to a compartment."""
-        for rxn in rxns:
-            self.add_rxn_to_compartment(rxn)
+        """Adds a list of reactions to a compartment.
+
+        The whole batch is deduplicated with one set pass and
+        appended with a single extend, instead of going through
+        add_rxn_to_compartment once per reaction."""
+        dup = self._rxn_ids.intersection(r.ID for r in rxns)
+        if dup:
+            logging.warn("Reactions {0} already in compartment {1}".format(sorted(dup),self.ID))
+        fresh = []
+        for r in rxns:
+            if r.ID not in self._rxn_ids:
+                fresh.append(r)
+                self._rxn_ids.add(r.ID)
+        self.reactions.extend(fresh)
             
+    @property
+    def effective_reactions(self):
+        """The reactions in effect in this compartment: any reactions
+        attached array-wide (see CompartmentArray.add_rxn_to_array)
+        followed by the compartment's own list, deduplicated by ID."""
+        if self._array is None or not self._array.global_rxns:
+            return self.reactions
+        merged = [r for r in self._array.global_rxns if r.ID not in self._rxn_ids]
+        return merged + self.reactions
+
     def show_all_rxns(self):
         """Returns a list of rxn strings with all reactions in the compartment"""
         rxn_strings = []
-        for r in self.reactions:
+        for r in self.effective_reactions:
             rxn_strings.append(r.display())
-            
+
         return rxn_strings
         
     def connect(self, other_compartment, conn_type, warn_overwrite=True):
         """Make a connection from this compartment to another one
         using the conn_type connection type."""
 
-        conn_tag = makeID(other_compartment.array_ID,other_compartment.ID)
+        conn_tag = other_compartment.tag
         if conn_tag in self.connections and warn_overwrite:
-            self_tag = makeID(self.array_ID,self.ID)
-            logging.warn("Warning: overwriting connection between {0} and {1}".format(self_tag,conn_tag))
+            logging.warn("Warning: overwriting connection between {0} and {1}".format(self.tag,conn_tag))
 
         self.connections[conn_tag] = (other_compartment, conn_type)
+        self._neighbor_idx = None
 
     def remove_connection(self, other_compartment):
         """Remove the connection with the other_compartment"""
 
-        conn_tag = makeID(other_compartment.array_ID,other_compartment.ID)
+        conn_tag = other_compartment.tag
         if conn_tag not in self.connections:
-            self_tag = makeID(self.array_ID,self.ID)
-            logging.warn("Warning: connection to remove between {0} and {1} does not exist".format(self_tag,conn_tag))
+            logging.warn("Warning: connection to remove between {0} and {1} does not exist".format(self.tag,conn_tag))
 
         val = self.connections.pop(conn_tag)
+        self._neighbor_idx = None
+
+    def finalize_neighbors(self, global_index):
+        """Materializes the connections dict as parallel arrays for
+        batch traversal: _neighbor_idx holds the neighbors' rows in
+        a global compartment table (given as a dict mapping
+        connection tags to int indices), and _conn_type_idx holds
+        for each neighbor an index into _conn_table, the list of
+        distinct Connection instances.  The dict remains the
+        mutable source of truth; connect/remove drop the arrays, so
+        callers should re-finalize after editing connections."""
+
+        self._conn_table = []
+        interned = {}
+        ctype_idx = []
+        for n,ct in self.connections.values():
+            ci = interned.get(id(ct))
+            if ci is None:
+                ci = len(self._conn_table)
+                interned[id(ct)] = ci
+                self._conn_table.append(ct)
+            ctype_idx.append(ci)
+
+        self._neighbor_idx = np.array([global_index[tag] for tag in self.connections],dtype=np.int32)
+        self._conn_type_idx = np.array(ctype_idx,dtype=np.int8)
+
+        return self._neighbor_idx, self._conn_type_idx
+
+    def reset_ID(self,new_ID,drop_array_ID=True):
+        """Rewrites this compartment's identity in place, for callers
+        that own the object and do not need the original preserved
+        (see FlatModel.add_compartment with owned=True).  Array-wide
+        reactions are materialized and the array back-reference is
+        dropped, exactly as copy() does for its duplicate."""
+
+        self.reactions = list(self.effective_reactions)
+        self._rxn_ids = {r.ID for r in self.reactions}
+        self.ID = new_ID
+        if drop_array_ID:
+            self.array_ID = None
+        self.tag = makeID(self.array_ID,self.ID)
+        self._array = None
+        self._neighbor_idx = None
 
     def copy(self,ID=None,delete_array_ID=False):
-        """Returns an identical copy of this compartment."""
-
-        if ID == None:
-            newID = self.ID
-        else:
-            newID = ID
+        """Returns an identical copy of this compartment.
+
+        The copy duplicates the instance attributes instead of
+        re-running __init__, which would redo the position assertions
+        and the pint volume conversion for every compartment copied
+        during flattening."""
+
+        new_comp = self.__class__.__new__(self.__class__)
+        for klass in type(self).__mro__:
+            for name in getattr(klass,'__slots__',()):
+                try:
+                    setattr(new_comp,name,getattr(self,name))
+                except AttributeError:
+                    # slots like _conn_table are only set by
+                    # finalize_neighbors and may be absent
+                    pass
+        if hasattr(self,'__dict__'):
+            new_comp.__dict__.update(self.__dict__)
+        if ID is not None:
+            new_comp.ID = ID
         if delete_array_ID:
-            new_aID = None
-        else:
-            new_aID = self.array_ID
-
-        if hasattr(self,'surface_area'):
-            new_comp = type(self)(newID, pos=self.pos, array_ID=new_aID, surface_area=self.surface_area)
-        else:
-            new_comp = type(self)(newID, pos=self.pos, array_ID=new_aID)
-            
-        new_comp.volume = self.volume
-        new_comp.connections = self.connections
-        new_comp.reactions = self.reactions
+            new_comp.array_ID = None
+        new_comp.tag = makeID(new_comp.array_ID,new_comp.ID)
+
+        # shallow-copy the containers: the copy must not share its
+        # connection dict and reaction list with the original, or
+        # later edits to one compartment silently leak into the other
+        new_comp.connections = self.connections.copy()
+        # materialize array-wide reactions into the copy, since the
+        # back-reference to the owning array is not carried over
+        new_comp.reactions = list(self.effective_reactions)
+        new_comp._rxn_ids = {r.ID for r in new_comp.reactions}
+        new_comp._array = None
+        new_comp._neighbor_idx = None
 
         return new_comp
 
 class Compartment1D(Compartment):
-    
+
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         assert len(self.pos)==1, "Error! position must be of length 1 for Compartment1D objects"
-        self.volume = (self.pos[0][1]-self.pos[0][0])
-        self.volume.to(unit.nm)
+        if self.volume is None:
+            self.volume = (self.pos[0][1]-self.pos[0][0])
+            self.volume = self.volume.to(unit.nm)
 
 class Compartment2D(Compartment):
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         assert len(self.pos)==2, "Error! position must be of length 2 for Compartment2D objects"
-        self.volume = (self.pos[0][1]-self.pos[0][0])*(self.pos[1][1]-self.pos[1][0])
-        self.volume.to(unit.nm**2)
+        if self.volume is None:
+            self.volume = (self.pos[0][1]-self.pos[0][0])*(self.pos[1][1]-self.pos[1][0])
+            self.volume = self.volume.to(unit.nm**2)
 
 class Compartment3D(Compartment):
     """
@@ -119,48 +228,62 @@ class Compartment3D(Compartment):
     'xy', 'yz', 'xz'.  Used by CompartmentArray3D for FicksConnections.
     """
 
+    __slots__ = ('surface_area',)
+
     def __init__(self, *args, surface_area=None, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.surface_area = surface_area
         assert len(self.pos)==3, "Error! position must be of length 3 for Compartment3D objects"
-        self.volume = (self.pos[0][1]-self.pos[0][0])*(self.pos[1][1]-self.pos[1][0])*(self.pos[2][1]-self.pos[2][0])
-        self.volume.to(unit.nm**3)
+        if self.volume is None:
+            self.volume = (self.pos[0][1]-self.pos[0][0])*(self.pos[1][1]-self.pos[1][0])*(self.pos[2][1]-self.pos[2][0])
+            self.volume = self.volume.to(unit.nm**3)
 
 class Reservoir(Compartment):
     """
     A compartment with a fixed concentration of different species.
+
+    Deliberately unslotted: reservoirs are few, and downstream code
+    subclasses them with ad-hoc attributes.
     """
 
-    def __init__(self, *args, concs={}, conc_funcs={}, **kwargs):
+    def __init__(self, *args, concs=None, conc_funcs=None, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.conc_funcs = {}
+        # empty reservoirs (pure sinks) are common; the flag lets
+        # system builders skip them without probing the dict
+        self._empty = not (concs or conc_funcs)
 
         # add keys from concs into self.conc_funcs
-        for key in concs.keys():
-            # convert concentrations to number of molecules per
-            # nanometer**3
-            concs[key].ito(1/unit.nm**3)
-
-            ## define a concentration function and attach it
-            def tmp_conc_func(t):
-                return concs[key].ito(1/unit.nm**3)
-            
-            self.conc_funcs[key] = tmp_conc_func
+        if concs:
+            for key,q in concs.items():
+                # convert to number of molecules per nanometer**3 once;
+                # the closure binds the converted value through its
+                # default argument, so each function keeps its own
+                # concentration (a loop-variable closure would leave all
+                # of them pointing at the last key) and no pint
+                # conversion happens per call
+                func = (lambda t, v=q.to(1/unit.nm**3): v)
+                # the constant tag lets CompiledDeriv fold the
+                # contribution into a precomputed vector instead of
+                # calling the function on every RHS evaluation
+                func.constant = q.to(1/unit.nm**3)
+                self.conc_funcs[key] = func
 
         # add keys from conc_funcs into self.conc_funcs
-        for key in conc_funcs.keys():
-            if key in concs:
-                raise ValueError("Error! Same quantity passed in both concs and conc_funcs!")
-            if not callable(conc_funcs[key]):
-                raise ValueError("Error! conc_funcs[{0}] is not callable!".format(key))
-            self.conc_funcs[key] = conc_funcs[key]
+        if conc_funcs:
+            for key in conc_funcs.keys():
+                if concs and key in concs:
+                    raise ValueError("Error! Same quantity passed in both concs and conc_funcs!")
+                if not callable(conc_funcs[key]):
+                    raise ValueError("Error! conc_funcs[{0}] is not callable!".format(key))
+                self.conc_funcs[key] = conc_funcs[key]
 
     def copy(self,ID=None,delete_array_ID=False):
         """Returns an identical copy of this compartment."""
 
-        if ID == None:
+        if ID is None:
             newID = self.ID
         else:
             newID = ID
@@ -10,22 +10,92 @@ kAB is a rate constant governing transport between compartment
 A and B.
 
 A note on units:
-The k values in the above equation are in units of 1/sec,
-and this is what is stored in the connection objects.
+The k values in the above equation are in units of 1/sec.  Each
+Connection subclass declares its storage units through its
+`canonical` attribute -- 1/sec for Anisotropic/IsotropicConnection,
+nm**dim/sec for DivByVConnection (divided by the compartment volume
+at system-construction time) -- and the shared SoA machinery in the
+base class converts to it exactly once.  This module is the single
+home for connection types; unit handling differs per class only
+through `canonical`, never through copied code paths.
 """
 
 from . import unit
 
+from enum import IntEnum
+import numpy as np
+
+class ConnKind(IntEnum):
+    """Integer tags for the Connection subclasses.  Edge tables
+    store these as int8, so per-edge dispatch downstream is an
+    integer compare instead of an isinstance check (and is
+    type-stable inside compiled kernels)."""
+    ANISO = 0
+    ISO = 1
+    DIVBYV = 2
+    FICKS = 3
+    RES = 4
+
+def _to_canonical(qs, canonical):
+    """Converts a list of pint Quantities to a float64 array of
+    magnitudes in canonical units.  When all entries share units the
+    conversion is a single vectorized pint call; otherwise it falls
+    back to one conversion per entry."""
+
+    if not qs:
+        return np.empty(0,dtype=np.float64)
+    if all(q.units == qs[0].units for q in qs):
+        q = np.array([q.magnitude for q in qs])*qs[0].units
+        return np.asarray(q.to(canonical).magnitude,dtype=np.float64)
+    return np.array([q.to(canonical).magnitude for q in qs])
+
 class Connection(object):
     """Basis class for connections.  The argument species_rates
-    is a dictionary, with Species IDs as keys and values hold 
-    rate constant tuples (k12,k21)."""
+    is a dictionary, with Species IDs as keys and values hold
+    rate constant tuples (k12,k21).
+
+    Internally the rates are stored structure-of-arrays style:
+    species_index maps a Species ID to a row in the contiguous
+    k_out and k_in float64 arrays, which hold the magnitudes in
+    the connection's canonical units.  The species_rates property
+    rebuilds the dict-of-Quantity-tuples view for legacy callers."""
+
+    __slots__ = ('dim','canonical','species_index','_rates_view',
+                 'k_out','k_in')
+
+    def _init_soa(self, species_rates):
+        """Normalizes the species_rates argument (bare rates are
+        expanded to (k,k) tuples) and stores the magnitudes in
+        canonical units in the k_out/k_in arrays.  self.canonical
+        must be set before calling."""
+
+        self.species_index = {s: i for i,s in enumerate(species_rates)}
+        self._rates_view = None
+
+        vals = [v if isinstance(v,tuple) else (v,v) for v in species_rates.values()]
+        if any(len(v) != 2 for v in vals):
+            raise ValueError("Error! Elements of species_rates dictionary should be tuples of length 2")
+        self.k_out = _to_canonical([v[0] for v in vals],self.canonical)
+        self.k_in = _to_canonical([v[1] for v in vals],self.canonical)
+
+    @property
+    def species_rates(self):
+        """Dict view {species_ID: (k_out, k_in)} with pint
+        Quantities, rebuilt lazily from the rate arrays."""
+        if self._rates_view is None:
+            self._rates_view = {s: (self.k_out[i]*self.canonical,
+                                    self.k_in[i]*self.canonical)
+                                for s,i in self.species_index.items()}
+        return self._rates_view
 
 class AnisotropicConnection(Connection):
-    
+
+    __slots__ = ()
+    kind = ConnKind.ANISO
+
     def __init__(self, species_rates,dim=3):
         """AnisotropicConnections are initialized with a dictionary
-        of species_rates, where the keys are Species IDs and the 
+        of species_rates, where the keys are Species IDs and the
         values are tuples of transport rates (k_out,k_in).
 
         Care should be taken to make sure these are applied in the
@@ -33,48 +103,54 @@ class AnisotropicConnection(Connection):
 
         Rates should be specified in units of 1/s.
         """
-        self.species_rates = species_rates
+        self.dim = dim
+        self.canonical = 1/unit.sec
 
-        for s in self.species_rates:
-            if type(self.species_rates[s]) is not tuple or len(self.species_rates[s]) != 2:
-                raise ValueError("Error! Elements of species_rates dictionary should be tuples of length 2")
-            self.species_rates[s][0].ito(1/unit.sec)
-            self.species_rates[s][1].ito(1/unit.sec)
+        # one generator pass over the values instead of a per-key
+        # branch with repeated dict lookups
+        if not all(type(v) is tuple and len(v) == 2 for v in species_rates.values()):
+            raise ValueError("Error! Elements of species_rates dictionary should be tuples of length 2")
+        self._init_soa(species_rates)
 
-    def _flip_tuple(t):
-        return (t[1],t[0])
-            
     def reverse(self):
-        rev_species_rates = {}
-        for s in self.species_rates:
-            rev_species_rates[s] = self._flip_tuple(self.species_rates[s])
+        """Returns a connection with the transport directions
+        swapped.  The rate arrays are treated as immutable after
+        construction, so the reverse shares them with the original
+        and the swap is O(1) regardless of the species count."""
+        rev = AnisotropicConnection.__new__(AnisotropicConnection)
+        rev.dim = self.dim
+        rev.canonical = self.canonical
+        rev.species_index = self.species_index
+        rev.k_out = self.k_in
+        rev.k_in = self.k_out
+        rev._rates_view = None
+
+        return rev
 
-        return AnisotropicConnection(rev_species_rates)
-            
 class IsotropicConnection(Connection):
 
+    __slots__ = ()
+    kind = ConnKind.ISO
+
     def __init__(self, species_rates,dim=3):
         """IsotropicConnections are initialized with a dictionary
-        of species_rates, where the keys are Species IDs and the 
+        of species_rates, where the keys are Species IDs and the
         values are transport rates.
 
         Rates should be specified in units of 1/s.
         """
-        self.species_rates = species_rates
         self.dim = dim
-
-        for s in self.species_rates:
-            k = self.species_rates[s]
-            if type(k) is not tuple:
-                self.species_rates[s] = (k,k)
-            self.species_rates[s][0].ito(1/unit.sec)
-            self.species_rates[s][1].ito(1/unit.sec)
+        self.canonical = 1/unit.sec
+        self._init_soa(species_rates)
 
 class DivByVConnection(Connection):
 
+    __slots__ = ()
+    kind = ConnKind.DIVBYV
+
     def __init__(self, species_rates,dim=3):
         """DivByVConnections are initialized with a dictionary
-        of species_rates, where the keys are Species IDs and the 
+        of species_rates, where the keys are Species IDs and the
         values are transport rates.
 
         Rates should be specified in units of L^d/s, where L is length
@@ -83,18 +159,46 @@ class DivByVConnection(Connection):
         These connections are divided by the compartment volume
         when constructing a system.
         """
-        self.species_rates = species_rates
         self.dim = dim
-
-        for s in self.species_rates:
-            k = self.species_rates[s]
-            if type(k) is not tuple:
-                self.species_rates[s] = (k,k)
-            self.species_rates[s][0].ito(unit.nm**self.dim/unit.sec)
-            self.species_rates[s][1].ito(unit.nm**self.dim/unit.sec)
+        self.canonical = unit.nm**self.dim/unit.sec
+        self._init_soa(species_rates)
             
+def _divbyv_from_d(species_d_constants, scale, dim):
+    """Builds a DivByVConnection from per-species diffusion constants
+    multiplied by a geometric scale factor (surface_area/distance).
+    When the diffusion constants share units the conversion to
+    canonical units happens in one vectorized pint call instead of
+    once per species."""
+
+    conn = DivByVConnection.__new__(DivByVConnection)
+    conn.dim = dim
+    conn.canonical = unit.nm**dim/unit.sec
+    conn.species_index = {s: i for i,s in enumerate(species_d_constants)}
+    conn._rates_view = None
+
+    vals = list(species_d_constants.values())
+    if not vals:
+        k = np.empty(0,dtype=np.float64)
+    else:
+        # bring the diffusion constants to a common unit, then apply
+        # the scale factor and convert the whole batch to canonical
+        # units in one pint call
+        d_arr = _to_canonical(vals,vals[0].units)
+        q = d_arr*vals[0].units*scale
+        k = np.asarray(q.to(conn.canonical).magnitude,dtype=np.float64)
+    # diffusive transport is symmetric and the rate arrays are
+    # treated as immutable after construction (see reverse), so both
+    # directions share one array
+    conn.k_out = k
+    conn.k_in = k
+
+    return conn
+
 class FicksConnection(Connection):
 
+    __slots__ = ('species_d_constants','surface_area','ic_distance')
+    kind = ConnKind.FICKS
+
     def __init__(self, species_d_constants, surface_area=None, ic_distance=None, dim=3):
         """FicksConnection types use diffusion constants for each
         Species, together with the widths and adjoining surface area
@@ -140,19 +244,18 @@ class FicksConnection(Connection):
 
         if self.surface_area is None or self.ic_distance is None:
             raise ValueError("Error!  This connection is not ready to be resolved.")
-        species_list = self.species_d_constants.keys()
-        rates = {}
-        for s,d in self.species_d_constants.items():
+        # the geometric factor is shared by all species; computing it
+        # once leaves a single vectorized multiply per resolve
+        scale = self.surface_area/self.ic_distance
 
-            # how are you going to get this volume?
-            
-            rates[s] = d*self.surface_area/self.ic_distance
-            rates[s].ito(unit.nm**self.dim/unit.sec)
-            
-        return DivByVConnection(rates,self.dim)
+        return _divbyv_from_d(self.species_d_constants,scale,self.dim)
 
 class ResConnection(Connection):
 
+    __slots__ = ('species_d_constants','surface_area','ic_distance',
+                 'face')
+    kind = ConnKind.RES
+
     def __init__(self, species_d_constants, surface_area=None, ic_distance=None, dim=3, face=None):
         """
         ResConnections are special connections from a compartment to a 
@@ -174,10 +277,6 @@ class ResConnection(Connection):
 
         if self.surface_area is None or self.ic_distance is None:
             raise ValueError("Error!  This connection is not ready to be resolved.")
-        species_list = self.species_d_constants.keys()
-        rates = {}
-        for s,d in self.species_d_constants.items():
-            rates[s] = d*self.surface_area/self.ic_distance
-            rates[s].ito(unit.nm**self.dim/unit.sec)
-            
-        return DivByVConnection(rates,self.dim)
+        scale = self.surface_area/self.ic_distance
+
+        return _divbyv_from_d(self.species_d_constants,scale,self.dim)
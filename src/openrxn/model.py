@@ -6,12 +6,15 @@ using a template, and then edited.
 
 from openrxn.compartments.compartment import Compartment
 from openrxn.reactions import Reaction
-from openrxn.compartments.ID import makeID
 from openrxn.connections import FicksConnection, ResConnection
+from openrxn import unit
 
 import numpy as np
 import networkx as nx
 
+# face key of the surface perpendicular to each axis (x, y, z)
+_FACE_KEYS = ('yz','xz','xy')
+
 class Model(object):
     """Models can hold both compartments and compartment 
     arrays. In order to be exported to a graph representation
@@ -29,7 +32,8 @@ class Model(object):
 
         self.periodic = None
         self.box_len = None
-        
+        self._resolve_cache = {}
+
         for a in arrays:
             self.add_array(a)
 
@@ -44,25 +48,30 @@ class Model(object):
             if self.periodic != array.periodic:
                 raise ValueError("Error! Adding array with incompatible periodicity to model ({0}) ({1})".format(self.periodic,array.periodic))
 
+        # box_len is held as a single pint array in nm, so the
+        # per-dimension compare/stack logic runs vectorized and
+        # downstream consumers (e.g. the minimum-image distance in
+        # resolve_ficks) can read it as an ndarray
+        box = np.array([b.to(unit.nm).magnitude for b in array.box_len])
         if self.box_len is None:
-            self.box_len = array.box_len
+            self.box_len = box*unit.nm
         else:
-            for i in range(len(array.box_len)):
-                # loop over dimensions
-                if self.box_len[i] != array.box_len[i]:
-                    if self.periodic[i]:
-                        raise ValueError("Error! Adding array with different size along a periodic dimension ({0}) ({1})".format(self.box_len[i],array.box_len[i]))
-                    else:
-                        # assume stacking behavior
-                        self.box_len[i] += array.box_len[i]
-
-        if array.array_ID in self.arrays.keys():
+            cur = self.box_len.to(unit.nm).magnitude
+            per = np.zeros(len(box),dtype=bool)
+            per[:] = self.periodic
+            mismatch = cur != box
+            if (mismatch & per).any():
+                raise ValueError("Error! Adding array with different size along a periodic dimension ({0}) ({1})".format(self.box_len,array.box_len))
+            # assume stacking behavior along mismatched free axes
+            self.box_len = np.where(mismatch,cur+box,cur)*unit.nm
+
+        if array.array_ID in self.arrays:
             raise ValueError("Error! Duplicate array ID in model ({0})".format(array.array_ID))
         self.arrays[array.array_ID] = array
 
 
     def add_compartment(self,compartment):
-        if compartment.ID in self.compartments.keys():
+        if compartment.ID in self.compartments:
             raise ValueError("Error! Duplicate compartment ID in model ({0})".format(compartment.ID))
         self.compartments[compartment.ID] = compartment
 
@@ -85,7 +94,12 @@ class Model(object):
         if len(missing) > 0:
             raise ValueError("Error! The following compartments are referred to in connections, but missing from the model: {0}".format(missing))
 
-        # resolve FicksConnections
+        # resolve FicksConnections; in a regular grid every edge
+        # along an axis shares the same surface_area/ic_distance, so
+        # resolutions are memoized by geometry and those edges end up
+        # pointing at a single shared DivByVConnection (one rate
+        # table per distinct face geometry instead of one per edge)
+        self._resolve_cache = {}
         for c in flatmodel.compartments.values():
             for label,conn in c.connections.items():
                 # conn is a tuple (other_compartment, connection)
@@ -96,6 +110,19 @@ class Model(object):
 
         return flatmodel
 
+    def _resolve_cached(self,conn):
+        """Resolves conn, reusing an earlier resolution if one with
+        the same rate table and geometry already exists."""
+
+        key = (id(conn),
+               conn.surface_area.to_base_units().magnitude,
+               conn.ic_distance.to_base_units().magnitude)
+        new_conn = self._resolve_cache.get(key)
+        if new_conn is None:
+            new_conn = conn.resolve()
+            self._resolve_cache[key] = new_conn
+        return new_conn
+
     def resolve_ficks(self,c1,c2,conn):
         """If surface area and inter-compartment distance are not attached
         to the FicksConnection, this function will attempt to compute them
@@ -111,40 +138,29 @@ class Model(object):
         pos2 = c2.pos
 
         if conn.surface_area is None:
-            # compute surface area
-            if pos1[0][1] == pos2[0][0] or pos1[0][0] == pos2[0][1]:
-                # adjoining x; use y,z face area
-                conn.surface_area = min(c1.surface_area['yz'],
-                                        c2.surface_area['yz'])
-            elif pos1[1][1] == pos2[1][0] or pos1[1][0] == pos2[1][1]:
-                # adjoining y; use x,z face area
-                conn.surface_area = min(c1.surface_area['xz'],
-                                        c2.surface_area['xz'])
-            elif pos1[2][1] == pos2[2][0] or pos1[2][0] == pos2[2][1]:
-                # adjoining z; use x,y face area
-                conn.surface_area = min(c1.surface_area['xy'],
-                                        c2.surface_area['xy'])
+            # find the adjoining axis and look its face key up in a
+            # table, instead of chaining three hand-written branches
+            for axis,face in enumerate(_FACE_KEYS):
+                if pos1[axis][1] == pos2[axis][0] or pos1[axis][0] == pos2[axis][1]:
+                    conn.surface_area = min(c1.surface_area[face],
+                                            c2.surface_area[face])
+                    break
             else:
                 raise ValueError("Error! Unable to determine adjoining face for regions: ({0}) and ({1})".format(pos1,pos2))
         if conn.ic_distance is None:
-            # compute inter-compartment distance
-            d = [0,0,0]
-            for i in range(len(d)):
-                d[i] = (0.5*(pos1[i][0]+pos1[i][1])-
-                        0.5*(pos2[i][0]+pos2[i][1]))
-                  
-            # get inter-compartmental distance
-            conn.ic_distance = 0
-            for i,dc in enumerate(d):
-                if self.periodic[i]:
-                    if dc*2 < -self.box_len[i]:
-                        dc += self.box_len[i]
-                    elif dc*2 > self.box_len[i]:
-                        dc -= self.box_len[i]
-                conn.ic_distance += dc**2
-            conn.ic_distance = np.sqrt(conn.ic_distance)
-
-        new_conn = conn.resolve()
+            # compute the minimum-image centroid distance in one
+            # numpy pass over the axes (d - box*round(d/box) is the
+            # vectorized form of the wrap branches)
+            d = np.array([(0.5*(pos1[i][0]+pos1[i][1]-
+                                pos2[i][0]-pos2[i][1])).to(unit.nm).magnitude
+                          for i in range(3)])
+            per = np.array(self.periodic,dtype=bool)
+            if per.any():
+                box = self.box_len.to(unit.nm).magnitude
+                d[per] -= box[per]*np.round(d[per]/box[per])
+            conn.ic_distance = np.sqrt((d*d).sum())*unit.nm
+
+        new_conn = self._resolve_cached(conn)
         # Note: Fick's connections are isotropic
         c1.connect(c2,new_conn,warn_overwrite=False)
         c2.connect(c1,new_conn,warn_overwrite=False)
@@ -162,27 +178,18 @@ class Model(object):
 
         if conn.surface_area is None:
             if conn.face in ['x','y','z']:
-                if conn.face == 'x':
-                    conn.surface_area = c1.surface_area['yz']
-                elif conn.face == 'y':
-                    conn.surface_area = c1.surface_area['xz']
-                elif conn.face == 'z':
-                    conn.surface_area = c1.surface_area['xy']
+                conn.surface_area = c1.surface_area[_FACE_KEYS['xyz'.index(conn.face)]]
             else:
                 raise ValueError("Error! To resolve the ResConnection, we need to know the surface area of the interface.")
 
         if conn.ic_distance is None:
             if conn.face in ['x','y','z']:
-                if conn.face == 'x':
-                    conn.ic_distance = c1.pos[0][1] - c1.pos[0][0]
-                elif conn.face == 'y':
-                    conn.ic_distance = c1.pos[1][1] - c1.pos[1][0]
-                elif conn.face == 'z':
-                    conn.ic_distance = c1.pos[2][1] - c1.pos[2][0]
+                axis = 'xyz'.index(conn.face)
+                conn.ic_distance = c1.pos[axis][1] - c1.pos[axis][0]
             else:
                 raise ValueError("Error! To resolve the ResConnection, we need to know the intercompartmental distance.")
 
-        new_conn = conn.resolve()
+        new_conn = self._resolve_cached(conn)
         c1.connect(res,new_conn,warn_overwrite=False)
         
 class FlatModel(object):
@@ -204,26 +211,34 @@ class FlatModel(object):
     def n_compartments(self):
         return len(self.compartments)
         
-    def add_compartment(self,compartment):
-        newID = makeID(compartment.array_ID,compartment.ID)
-        if newID in self.compartments.keys():
+    def add_compartment(self,compartment,owned=False):
+        """Adds a compartment under its flat tag.  By default the
+        compartment is copied so the source model stays intact; pass
+        owned=True to transfer ownership and rewrite the object in
+        place, which skips one object duplication per compartment
+        (worthwhile when flattening large arrays that will be
+        discarded afterwards)."""
+        newID = compartment.tag
+        if newID in self.compartments:
             raise ValueError("Error! Duplicate compartment ID in model ({0})".format(newID))
-        self.compartments[newID] = compartment.copy(ID=newID,delete_array_ID=True)
+        if owned:
+            compartment.reset_ID(newID)
+            self.compartments[newID] = compartment
+        else:
+            self.compartments[newID] = compartment.copy(ID=newID,delete_array_ID=True)
 
-    def add_compartments(self,compartments):
+    def add_compartments(self,compartments,owned=False):
         for c in compartments:
-            self.add_compartment(c)
+            self.add_compartment(c,owned=owned)
 
     def find_missing_compartments(self):
         """Returns a list of missing compartment IDs."""
-        
-        missing = []
+
+        needed = set()
         for c in self.compartments.values():
-            for nbor in c.connections.keys():
-                if nbor not in self.compartments:
-                    missing.append(nbor)
+            needed.update(c.connections)
 
-        return missing
+        return list(needed - self.compartments.keys())
 
     def add_rxn(self,rxn,compartments='all'):
         """Adds a reaction to a set of compartments.
@@ -243,37 +258,46 @@ class FlatModel(object):
             self.compartments[c].add_rxn_to_compartment(rxn)
     
     def to_graph(self,scale=10):
-        """Exports a networkX.DiGraph where the nodes are 
+        """Exports a networkX.DiGraph where the nodes are
         compartments and the edges are connections."""
 
         graph = nx.DiGraph()
 
-        # add all the nodes
-        for c_name, c in self.compartments.items():
-            graph.add_node(c_name)
-            graph.node[c_name]['viz'] = {}
-
-            x = scale*0.5*(c.pos[0][0] + c.pos[0][1]).magnitude
-            y = scale*0.5*(c.pos[1][0] + c.pos[1][1]).magnitude
-            z = scale*0.5*(c.pos[2][0] + c.pos[2][1]).magnitude
-            vis_x,vis_y = self._project_xy((x,y,z))
-            
-            graph.node[c_name]['viz']['position'] = {'x': float(vis_x), 'y': float(vis_y)}
-
-        # build an edges list
+        # compute all node positions in one vectorized projection
+        # instead of six pint magnitude extractions and a Python
+        # branch chain per node
+        names = list(self.compartments.keys())
+        comps = list(self.compartments.values())
+        ctr = np.array([[0.5*(p[0]+p[1]).magnitude for p in c.pos]
+                        for c in comps])*scale
+        vis_x,vis_y = self._project_xy((ctr[:,0],ctr[:,1],ctr[:,2]))
+
+        graph.add_nodes_from(
+            (name,{'viz': {'position': {'x': float(px), 'y': float(py)}}})
+            for name,px,py in zip(names,vis_x,vis_y))
+
+        # build an edges list; connections are shared across edges
+        # after resolution, so the rate dicts are built once per
+        # distinct connection
         edges = []
+        rates_cache = {}
         for c_name, c in self.compartments.items():
             for e_name, conn in c.connections.items():
-                new_rates_dict = {}
-                for spec, tup in conn[1].species_rates.items():
-                    new_rates_dict[spec] = tup[0].magnitude
+                new_rates_dict = rates_cache.get(id(conn[1]))
+                if new_rates_dict is None:
+                    new_rates_dict = {spec: tup[0].magnitude
+                                      for spec,tup in conn[1].species_rates.items()}
+                    rates_cache[id(conn[1])] = new_rates_dict
                 edges.append((c_name,e_name,new_rates_dict))
         graph.add_edges_from(edges)
 
         return graph
 
     def _project_xy(self,pos,alpha=0.7,beta=1.2):
-        # Converts x,y,z positions to x,y positions using an orthographic projection
+        """Converts x,y,z positions to x,y positions using an
+        orthographic projection.  pos is a (x,y,z) triple of scalars
+        or of equal-length arrays; the arithmetic broadcasts, so
+        to_graph projects all nodes in one call."""
 
         x_vis = pos[0] - alpha*pos[1]
         y_vis = pos[2] + beta*pos[1]
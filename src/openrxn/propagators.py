@@ -1,82 +1,487 @@
+import math
+
 import numpy as np
+from numba import njit
+
+@njit(cache=True, fastmath=True)
+def _propensity(i, y, rate, q_idx, q_num, q_ptr):
+    # for a two-body reaction:  r = k*y*(y-1)
+    r = rate[i]
+    for m in range(q_ptr[i], q_ptr[i+1]):
+        idx = q_idx[m]
+        for j in range(q_num[m]):
+            v = y[idx] - j
+            if v < 0:
+                v = 0.
+            r *= v
+    return r
+
+@njit(cache=True)
+def _bit_add(bit, i, delta):
+    # add delta to leaf i (0-based) of the Fenwick tree
+    j = i+1
+    while j < bit.shape[0]:
+        bit[j] += delta
+        j += j & (-j)
+
+@njit(cache=True)
+def _bit_total(bit, n):
+    # prefix sum over all n leaves
+    s = 0.
+    j = n
+    while j > 0:
+        s += bit[j]
+        j -= j & (-j)
+    return s
+
+@njit(cache=True)
+def _bit_sample(bit, n, topk, u):
+    # descend to the smallest index whose prefix sum exceeds u
+    pos = 0
+    k = topk
+    while k > 0:
+        nxt = pos+k
+        if nxt <= n and bit[nxt] <= u:
+            pos = nxt
+            u -= bit[nxt]
+        k >>= 1
+    if pos >= n:
+        pos = n-1
+    return pos
+
+# fastmath lets LLVM auto-vectorize the propensity and selection
+# loops (SIMD over reactions)
+@njit(cache=True, fastmath=True)
+def _ssa_kernel(y, t_init, t_final, rate, q_idx, q_num, q_ptr,
+                d_idx, d_val, d_ptr, upd_idx, upd_ptr):
+    n = rate.shape[0]
+
+    # build vector of reaction rates (r); partial sums live in a
+    # Fenwick tree, so selection and rate updates are both O(log n)
+    # per event instead of the O(n) scan-and-sum
+    r = np.zeros(n)
+    bit = np.zeros(n+1)
+    for i in range(n):
+        r[i] = _propensity(i, y, rate, q_idx, q_num, q_ptr)
+        _bit_add(bit, i, r[i])
+    topk = 1
+    while topk*2 <= n:
+        topk *= 2
+
+    # scratch for deduplicating dependent-process updates within one
+    # event (a reaction touching several quantities can list the
+    # same dependent process more than once); allocated once, no
+    # per-event set construction
+    dirty = np.zeros(n,dtype=np.bool_)
+    stack = np.empty(n,dtype=np.int32)
+
+    t = t_init
+    while t < t_final:
+        rsum = _bit_total(bit, n)
+        if rsum <= 0:
+            # no more reactions can occur
+            t = t_final
+            break
+
+        # choose a reaction to execute
+        u = np.random.random()*rsum
+        i = _bit_sample(bit, n, topk, u)
+        if r[i] <= 0:
+            # cancellation residue in the tree let the draw land on
+            # a dead reaction; rebuild the sums exactly and redraw
+            bit[:] = 0.
+            for j in range(n):
+                _bit_add(bit, j, r[j])
+            continue
+
+        # update y
+        for m in range(d_ptr[i], d_ptr[i+1]):
+            y[d_idx[m]] += d_val[m]
+
+        # update t
+        t += -math.log(np.random.random())/rsum
+
+        # update only the necessary r values, each at most once
+        ns = 0
+        for m in range(d_ptr[i], d_ptr[i+1]):
+            qi = d_idx[m]
+            for mm in range(upd_ptr[qi], upd_ptr[qi+1]):
+                pj = upd_idx[mm]
+                if not dirty[pj]:
+                    dirty[pj] = True
+                    stack[ns] = pj
+                    ns += 1
+        for m in range(ns):
+            pj = stack[m]
+            dirty[pj] = False
+            rnew = _propensity(pj, y, rate, q_idx, q_num, q_ptr)
+            if rnew != r[pj]:
+                _bit_add(bit, pj, rnew-r[pj])
+                r[pj] = rnew
+
+    return t
+
+@njit(cache=True)
+def _sift(heap, pos, tval, j):
+    # restore min-heap order for the node at heap position j
+    n = heap.shape[0]
+    while j > 0:
+        parent = (j-1)//2
+        if tval[heap[j]] < tval[heap[parent]]:
+            heap[j], heap[parent] = heap[parent], heap[j]
+            pos[heap[j]] = j
+            pos[heap[parent]] = parent
+            j = parent
+        else:
+            break
+    while True:
+        m = j
+        l = 2*j+1
+        r = l+1
+        if l < n and tval[heap[l]] < tval[heap[m]]:
+            m = l
+        if r < n and tval[heap[r]] < tval[heap[m]]:
+            m = r
+        if m == j:
+            break
+        heap[j], heap[m] = heap[m], heap[j]
+        pos[heap[j]] = j
+        pos[heap[m]] = m
+        j = m
+
+@njit(cache=True)
+def _nrm_kernel(y, t_init, t_final, rate, q_idx, q_num, q_ptr,
+                d_idx, d_val, d_ptr, dep_idx, dep_ptr):
+    n = rate.shape[0]
+
+    # putative next-firing times for every reaction, kept in an
+    # indexed min-heap (Gibson-Bruck next-reaction method)
+    a = np.zeros(n)
+    tval = np.empty(n)
+    pos = np.empty(n,dtype=np.int64)
+
+    t = t_init
+    for i in range(n):
+        a[i] = _propensity(i, y, rate, q_idx, q_num, q_ptr)
+        if a[i] > 0:
+            tval[i] = t - math.log(np.random.random())/a[i]
+        else:
+            tval[i] = np.inf
+    # a sorted array is a valid min-heap; this is done once per
+    # propagate call, so the O(n log n) sort is immaterial
+    heap = np.argsort(tval)
+    for j in range(n):
+        pos[heap[j]] = j
+
+    while n > 0:
+        i = heap[0]
+        if tval[i] >= t_final:
+            break
+        t = tval[i]
+
+        # fire reaction i
+        for m in range(d_ptr[i], d_ptr[i+1]):
+            y[d_idx[m]] += d_val[m]
+
+        # update only the dependent reactions, reusing the old
+        # exponential draw for reactions other than the fired one
+        for m in range(dep_ptr[i], dep_ptr[i+1]):
+            k = dep_idx[m]
+            a_old = a[k]
+            a_new = _propensity(k, y, rate, q_idx, q_num, q_ptr)
+            if a_new <= 0:
+                tval[k] = np.inf
+            elif k == i or a_old <= 0:
+                tval[k] = t - math.log(np.random.random())/a_new
+            else:
+                tval[k] = t + (a_old/a_new)*(tval[k]-t)
+            a[k] = a_new
+            _sift(heap, pos, tval, pos[k])
+
+    return t_final
+
+@njit(cache=True)
+def _tau_kernel(y, t_init, t_final, epsilon, rate, q_idx, q_num, q_ptr,
+                d_idx, d_val, d_ptr):
+    n = rate.shape[0]
+    size = y.shape[0]
+    r = np.zeros(n)
+    k = np.zeros(n,dtype=np.int64)
+    mu = np.zeros(size)
+    sig2 = np.zeros(size)
+
+    t = t_init
+    while t < t_final:
+        rsum = 0.
+        for i in range(n):
+            r[i] = _propensity(i, y, rate, q_idx, q_num, q_ptr)
+            rsum += r[i]
+        if rsum <= 0:
+            # no more reactions can occur
+            t = t_final
+            break
+
+        # tau selection following Cao, Gillespie and Petzold (2006):
+        # bound the expected relative change of each quantity by epsilon
+        mu[:] = 0.
+        sig2[:] = 0.
+        for j in range(n):
+            for m in range(d_ptr[j], d_ptr[j+1]):
+                mu[d_idx[m]] += d_val[m]*r[j]
+                sig2[d_idx[m]] += d_val[m]*d_val[m]*r[j]
+
+        tau = t_final - t
+        for i in range(size):
+            bound = epsilon*y[i]
+            if bound < 1.:
+                bound = 1.
+            if mu[i] != 0:
+                c = bound/abs(mu[i])
+                if c < tau:
+                    tau = c
+            if sig2[i] > 0:
+                c = bound*bound/sig2[i]
+                if c < tau:
+                    tau = c
+
+        if tau*rsum < 10.:
+            # leaping would collapse only a few events; take an
+            # exact SSA step instead
+            u = np.random.random()*rsum
+            acc = 0.
+            i = n-1
+            for j in range(n):
+                acc += r[j]
+                if u < acc:
+                    i = j
+                    break
+            for m in range(d_ptr[i], d_ptr[i+1]):
+                y[d_idx[m]] += d_val[m]
+            t += -math.log(np.random.random())/rsum
+            continue
+
+        # draw the number of firings of each reaction in this leap;
+        # if a population goes negative, revert and retry with half
+        # the leap
+        while True:
+            for j in range(n):
+                k[j] = np.random.poisson(r[j]*tau)
+            for j in range(n):
+                if k[j] > 0:
+                    for m in range(d_ptr[j], d_ptr[j+1]):
+                        y[d_idx[m]] += k[j]*d_val[m]
+            neg = False
+            for i in range(size):
+                if y[i] < 0:
+                    neg = True
+                    break
+            if not neg:
+                break
+            for j in range(n):
+                if k[j] > 0:
+                    for m in range(d_ptr[j], d_ptr[j+1]):
+                        y[d_idx[m]] -= k[j]*d_val[m]
+            tau *= 0.5
+
+        t += tau
 
-def Gillespie(processes,update_list,time_range,y0):
+    return t
+
+@njit(cache=True)
+def _seed_kernel(seed):
+    np.random.seed(seed)
+
+# Generator (PCG64) for all Python-level draws; the compiled kernels
+# use Numba's internal per-thread random state instead, since
+# Generator objects cannot be passed into @njit functions
+rng = np.random.default_rng()
+
+def seed_rngs(seed):
+    """Seeds both the module-level Generator (rng) and the separate
+    random state used inside Numba-compiled kernels.  Child seeds are
+    derived through a SeedSequence, so the two streams are
+    independent."""
+    global rng
+    ss = np.random.SeedSequence(int(seed))
+    rng = np.random.default_rng(ss)
+    _seed_kernel(int(ss.generate_state(1)[0]) % 2**32)
+
+def pack_processes(processes, update_list):
+    """Packs a list of processes (rate, q_list, delta_list) and a
+    process update list (see GillespieSystem._build_processes) into
+    flat numpy arrays suitable for the Numba propagator kernel.
+
+    Returns a tuple of arrays:
+
+    rate :            reaction rate constants (float64, in 1/s)
+    q_idx, q_num, q_ptr :  CSR storage of the (index, number) tuples
+                           that determine each reaction's propensity
+    d_idx, d_val, d_ptr :  CSR storage of the (index, delta) tuples
+                           that update the state vector
+    upd_idx, upd_ptr :     CSR storage of the update list, mapping
+                           each quantity to the processes whose
+                           propensities depend on it
+    """
+    rate = np.array([p[0] for p in processes],dtype=np.float64)
+
+    q_idx = []
+    q_num = []
+    q_ptr = [0]
+    d_idx = []
+    d_val = []
+    d_ptr = [0]
+    for p in processes:
+        for idx,num in p[1]:
+            q_idx.append(idx)
+            q_num.append(num)
+        q_ptr.append(len(q_idx))
+        for idx,delta in p[2]:
+            d_idx.append(idx)
+            d_val.append(delta)
+        d_ptr.append(len(d_idx))
+
+    upd_idx = []
+    upd_ptr = [0]
+    for procs in update_list:
+        upd_idx += procs
+        upd_ptr.append(len(upd_idx))
+
+    return (rate,
+            np.array(q_idx,dtype=np.int32),
+            np.array(q_num,dtype=np.int32),
+            np.array(q_ptr,dtype=np.int32),
+            np.array(d_idx,dtype=np.int32),
+            np.array(d_val,dtype=np.int32),
+            np.array(d_ptr,dtype=np.int32),
+            np.array(upd_idx,dtype=np.int32),
+            np.array(upd_ptr,dtype=np.int32))
+
+def pack_dependencies(processes,size):
+    """Builds the reaction-to-reaction dependency graph used by the
+    next-reaction method: reaction k depends on reaction i if firing
+    i changes a quantity that appears in k's q_list.  Each reaction
+    also depends on itself (its exponential draw is consumed).
+
+    Returns (dep_idx, dep_ptr) in the same CSR layout as the other
+    packed arrays.
+    """
+    reads = [[] for idx in range(size)]
+    for i,p in enumerate(processes):
+        for idx,num in p[1]:
+            reads[idx].append(i)
+
+    dep_idx = []
+    dep_ptr = [0]
+    for i,p in enumerate(processes):
+        dep = {i}
+        for idx,delta in p[2]:
+            dep.update(reads[idx])
+        dep_idx += sorted(dep)
+        dep_ptr.append(len(dep_idx))
+
+    return (np.array(dep_idx,dtype=np.int32),
+            np.array(dep_ptr,dtype=np.int32))
+
+def Gillespie(packed,time_range,y0,y_out=None):
     """A propagator function that moves the state vector (y)
-    forward in time.
+    forward in time using the Gillespie direct method.  The
+    inner loop runs entirely inside a Numba-compiled kernel.
 
     Inputs:
 
-    processes :  a list of "reactions" with elements of the 
-                 form: (rate, q_list, delta_list).  Where 
-                 the rate constant is in 1/s, the q_list is a 
-                 list of tuples (idx, number) that describe how
-                 many of each species are involved in the reaction
-                 and delta_list is a list of tuples (idx, delta)
-                 that describe how to update the state vector if
-                 that reaction is chosen.
-
-    update_list: a list (same size as y0) with the elements 
-                 being lists of processes that a given quantity 
-                 is involved in.  It is used to make this propagator 
-                 more efficient, only updating the processes that 
-                 have changed after each reaction.
-    
-    time_range : a tuple (t_init, t_final) describing the range 
+    packed :     the packed process arrays returned by
+                 pack_processes.
+
+    time_range : a tuple (t_init, t_final) describing the range
                  over which reactions should be processed
 
     y0 :         the initial value of the state vector
 
+    y_out :      optional preallocated array receiving the final
+                 state; reusing one buffer across an ensemble of
+                 trajectories avoids an allocation per call
+
     Returns:
 
     y_final :    the final value of the state vector
     t_final :    the actual final time
     """
 
-    t = time_range[0]
+    if y_out is None:
+        y_out = np.empty_like(y0)
+    np.copyto(y_out, y0)
+    t = _ssa_kernel(y_out, time_range[0], time_range[1], *packed)
 
-    y = y0.copy()
-    n = len(processes)
+    return y_out, t
 
-    # build vector of reaction rates (r)
-    r = np.zeros(n)
-    for i,p in enumerate(processes):
-        r[i] = p[0]
-        for idx, num in p[1]:
-            # for a two-body reaction:  r = k*y*(y-1)
-            for j in range(num):
-                r[i] *= max(0,y[idx]-j)
-
-    while t < time_range[1]:
-        # keep track of processes that will need to be updated
-        to_update = []
-        
-        # save 1/rsum since multiplication is faster
-        oorsum = 1/r.sum()
-        
-        # choose a reaction to execute
-        i = np.random.choice(range(n),p=r*oorsum)
+def NextReaction(packed,deps,time_range,y0,y_out=None):
+    """A propagator function implementing the Gibson-Bruck
+    next-reaction method.  Putative firing times for all reactions
+    are kept in an indexed binary heap, and after each firing only
+    the reactions listed in the dependency graph (see
+    pack_dependencies) are updated, rescaling their existing
+    exponential draws rather than drawing new ones.  This scales as
+    O(log R) per event instead of O(R), which pays off for large
+    compartment arrays where most reactions are unaffected by any
+    given firing.
 
-        # update y
-        for idx, d in processes[i][2]:
-            y[idx] += d
-            to_update += update_list[idx]
+    Inputs and outputs are as for Gillespie, with deps being the
+    (dep_idx, dep_ptr) pair from pack_dependencies.
+    """
 
-        # update t
-        a = np.random.random()
-        t += -np.log(a)*oorsum
+    if y_out is None:
+        y_out = np.empty_like(y0)
+    np.copyto(y_out, y0)
+    t = _nrm_kernel(y_out, time_range[0], time_range[1], *packed[:7], *deps)
 
-        # update only the necessary r values
-        for i in set(to_update):
-            r[i] = processes[i][0]
-            for idx, num in processes[i][1]:
-                # for a two-body reaction:  r = k*y*(y-1)
-                for j in range(num):
-                    r[i] *= max(0,y[idx]-j)
+    return y_out, t
 
-    return y, t
+def TauLeap(packed,time_range,y0,epsilon=0.03,y_out=None):
+    """A propagator function that moves the state vector (y)
+    forward in time with tau-leaping: many reaction firings per
+    step are collapsed into Poisson draws, with the leap size
+    chosen so the expected relative change of each quantity stays
+    below epsilon.  Falls back to exact SSA steps when a leap
+    would cover only a few events.
+
+    Inputs and outputs are as for Gillespie; the update-list
+    arrays in packed are not used since all propensities are
+    recomputed each leap.
+    """
+
+    if y_out is None:
+        y_out = np.empty_like(y0)
+    np.copyto(y_out, y0)
+    t = _tau_kernel(y_out, time_range[0], time_range[1], epsilon, *packed[:7])
 
-        
+    return y_out, t
+
+# serial over trajectories on purpose: parallel=True deadlocks with
+# the fork()-based ensemble workers, and the whole batch already runs
+# inside one compiled kernel (see _build_edges for the precedent)
+@njit(cache=True, fastmath=True)
+def _tau_ensemble_kernel(Y, t_init, t_final, epsilon, rate, q_idx, q_num, q_ptr,
+                         d_idx, d_val, d_ptr, t_out):
+    for w in range(Y.shape[0]):
+        t_out[w] = _tau_kernel(Y[w], t_init, t_final, epsilon, rate,
+                               q_idx, q_num, q_ptr, d_idx, d_val, d_ptr)
+    return t_out
+
+def TauLeapEnsemble(packed,time_range,n_traj,y0,epsilon=0.03):
+    """Advances n_traj independent replicate trajectories, all
+    started from y0, with tau-leaping inside a single compiled
+    kernel.  Compared to running TauLeap n_traj times from Python
+    this pays the kernel entry and array setup once for the whole
+    batch; for process-level parallelism across cores, use
+    openrxn.systems.ensemble.ensemble_run instead.
+
+    Returns (Y, t) where Y has shape (n_traj, len(y0)), one final
+    state per row, and t is the array of final times.
+    """
 
+    Y = np.repeat(y0[np.newaxis,:],n_traj,axis=0)
+    t_out = np.empty(n_traj)
+    _tau_ensemble_kernel(Y, time_range[0], time_range[1], epsilon,
+                         *packed[:7], t_out)
 
-        
-        
+    return Y, t_out
@@ -19,6 +19,14 @@ r1 = Reaction('combustion',[m,o2],[co2,w],[1,2],[1,2],kf=kf,kr=kr)
 """
 
 import logging
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+# integer-index view of a single Reaction (see Reaction.bind)
+BoundReaction = namedtuple('BoundReaction',
+                           ['kf','kr','r_idx','r_num','p_idx','p_num'])
 
 class Species(object):
     """Species can be either reactants or products and can
@@ -61,8 +69,14 @@ class Reaction(object):
         self.kf = kf
         self.kr = kr
 
-        self.reactant_IDs = [s.ID for s in self.reactants]
-        self.product_IDs = [s.ID for s in self.products]
+        # interned ID tuples keep .index() for positional lookups;
+        # the frozensets make the frequent membership tests O(1)
+        self.reactant_IDs = tuple(sys.intern(s.ID) if type(s.ID) is str else s.ID
+                                  for s in self.reactants)
+        self.product_IDs = tuple(sys.intern(s.ID) if type(s.ID) is str else s.ID
+                                 for s in self.products)
+        self.reactant_ID_set = frozenset(self.reactant_IDs)
+        self.product_ID_set = frozenset(self.product_IDs)
 
         # todo: assure that the units on the rates are correct
 
@@ -99,4 +113,78 @@ class Reaction(object):
 
         return(to_print + rate_str)
 
-        
+    def bind(self, species_index):
+        """Returns a BoundReaction namedtuple with the reactant and
+        product species mapped to integer rows through the
+        species_index dict and the stoichiometries as int32 arrays.
+        Consumers in tight loops read plain ints from the arrays
+        instead of chasing reaction -> Species -> ID attribute
+        chains.  For whole reaction lists see ReactionTable."""
+
+        return BoundReaction(
+            self.kf, self.kr,
+            np.array([species_index[s.ID] for s in self.reactants],dtype=np.int32),
+            np.array(self.stoich_r,dtype=np.int32),
+            np.array([species_index[s.ID] for s in self.products],dtype=np.int32),
+            np.array(self.stoich_p,dtype=np.int32))
+
+class ReactionTable(object):
+    """Structure-of-arrays view of a list of Reactions.
+
+    Walking Reaction objects means a Python attribute lookup per
+    reactant, per reaction, per compartment; system builders that
+    evaluate thousands of reactions instead read this table, where
+    the whole batch sits in a handful of contiguous arrays:
+
+    kf, kr :               rate-constant magnitudes (float64); the
+                           matching pint units are kept per reaction
+                           in kf_units/kr_units, since they vary with
+                           reaction order.  Conversion to a common
+                           canonical (including any compartment
+                           volume factors) is left to the consumer.
+    r_idx, r_num, r_ptr :  CSR storage of the reactant species rows
+                           (via the species_index mapping) and their
+                           stoichiometries (int32)
+    p_idx, p_num, p_ptr :  the same for products
+    """
+
+    @classmethod
+    def from_reactions(cls, reactions, species_index):
+        """Flattens reactions into a ReactionTable, mapping Species
+        IDs to integer rows through the species_index dict."""
+
+        table = cls.__new__(cls)
+        table.reactions = list(reactions)
+        table.kf = np.array([getattr(r.kf,'magnitude',r.kf) for r in table.reactions],dtype=np.float64)
+        table.kr = np.array([getattr(r.kr,'magnitude',r.kr) for r in table.reactions],dtype=np.float64)
+        table.kf_units = [getattr(r.kf,'units',None) for r in table.reactions]
+        table.kr_units = [getattr(r.kr,'units',None) for r in table.reactions]
+
+        r_idx = []
+        r_num = []
+        r_ptr = [0]
+        p_idx = []
+        p_num = []
+        p_ptr = [0]
+        for r in table.reactions:
+            for j,s in enumerate(r.reactants):
+                r_idx.append(species_index[s.ID])
+                r_num.append(r.stoich_r[j])
+            r_ptr.append(len(r_idx))
+            for j,s in enumerate(r.products):
+                p_idx.append(species_index[s.ID])
+                p_num.append(r.stoich_p[j])
+            p_ptr.append(len(p_idx))
+
+        table.r_idx = np.array(r_idx,dtype=np.int32)
+        table.r_num = np.array(r_num,dtype=np.int32)
+        table.r_ptr = np.array(r_ptr,dtype=np.int32)
+        table.p_idx = np.array(p_idx,dtype=np.int32)
+        table.p_num = np.array(p_num,dtype=np.int32)
+        table.p_ptr = np.array(p_ptr,dtype=np.int32)
+
+        return table
+
+    def __len__(self):
+        return len(self.reactions)
+
@@ -18,7 +18,7 @@ from openrxn import unit
 from openrxn.systems.state import State
 from openrxn.systems.deriv import DerivFuncBuilder
 from openrxn.systems.system import System
-from openrxn.propagators import Gillespie
+from openrxn.propagators import Gillespie, NextReaction, TauLeap, TauLeapEnsemble, pack_processes, pack_dependencies, seed_rngs
 from openrxn.compartments.compartment import Reservoir
 from openrxn.connections import DivByVConnection
 
@@ -29,21 +29,94 @@ EPSILON = 1e-8
 
 class GillespieSystem(System):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, method='direct', seed=None, **kwargs):
+        """method selects the SSA variant used by propagate:
+        'direct' for the exact Gillespie direct method, 'nrm' for the
+        Gibson-Bruck next-reaction method, which updates only the
+        reactions affected by each firing (O(log R) per event) and
+        is preferred for large compartment arrays, or 'tau' for
+        approximate tau-leaping, which fires many reactions per step
+        and is much faster when copy numbers are large.  Keep 'direct'
+        or 'nrm' for small-count regimes where the leap approximation
+        breaks down.
+
+        seed, if given, seeds the random streams through
+        openrxn.propagators.seed_rngs for reproducible runs."""
 
         super().__init__(*args,**kwargs)
-        self.processes, self.process_update_list = self._build_processes()
+        if method not in ['direct','nrm','tau']:
+            raise ValueError("method must be 'direct', 'nrm' or 'tau'")
+
+        # Gillespie states are molecule counts; pinning the state
+        # vector to a contiguous int64 array keeps the propagator
+        # kernels free of per-step dtype promotion
+        self.state.q_val = np.ascontiguousarray(self.state.q_val,dtype=np.int64)
+        self.method = method
+        if seed is not None:
+            seed_rngs(seed)
+
+        self._rate_cache = {}
+
+        # compiling the process arrays only depends on the model, so
+        # cache them there: building many systems from the same
+        # FlatModel (e.g. Gillespie replicates) pays the cost once.
+        # Note that the cache goes stale if the model is modified
+        # after the first system is built.
+        cached = getattr(self.model,'_compiled_processes',None)
+        if cached is None:
+            self.processes, self.process_update_list = self._build_processes()
+            self.packed_processes = pack_processes(self.processes,self.process_update_list)
+            self.model._compiled_processes = (self.processes,
+                                              self.process_update_list,
+                                              self.packed_processes)
+        else:
+            self.processes, self.process_update_list, self.packed_processes = cached
+
+        if method == 'nrm':
+            cached_deps = getattr(self.model,'_compiled_deps',None)
+            if cached_deps is None:
+                cached_deps = pack_dependencies(self.processes,self.state.size)
+                self.model._compiled_deps = cached_deps
+            self.packed_deps = cached_deps
 
     def propagate(self,t_interval,**kwargs):
         """
-        Interfaces with openrxn.propagators.Gillespie()
+        Interfaces with openrxn.propagators.Gillespie(),
+        NextReaction() or TauLeap(), depending on self.method.
+        For method='tau', an epsilon keyword (default 0.03) sets the
+        Cao-Gillespie leap error control.
         """
 
-        new_q, final_t = Gillespie(self.processes,self.process_update_list,t_interval,self.state.q_val)
+        if self.method == 'nrm':
+            new_q, final_t = NextReaction(self.packed_processes,self.packed_deps,
+                                          t_interval,self.state.q_val)
+        elif self.method == 'tau':
+            new_q, final_t = TauLeap(self.packed_processes,t_interval,self.state.q_val,
+                                     epsilon=kwargs.get('epsilon',0.03))
+        else:
+            new_q, final_t = Gillespie(self.packed_processes,t_interval,self.state.q_val)
         self.state.q_val = new_q
 
         return {'new_q': new_q, 'final_t': final_t}
 
+    def propagate_ensemble(self,n_traj,t_interval,epsilon=0.03):
+        """Runs n_traj independent replicate trajectories, all
+        starting from the current state, with tau-leaping in one
+        compiled kernel.  The system state is not modified; the
+        per-replicate final states come back as the rows of the
+        returned 'q_ensemble' array.
+
+        This covers the common case of gathering statistics over
+        many replicates without paying one Python propagate call
+        each; for exact-SSA replicates spread over cores, see
+        openrxn.systems.ensemble.ensemble_run.
+        """
+
+        Y, final_t = TauLeapEnsemble(self.packed_processes,t_interval,
+                                     n_traj,self.state.q_val,epsilon=epsilon)
+
+        return {'q_ensemble': Y, 'final_t': final_t}
+
     def _build_processes(self):
         """
         Processes is a list with elements of format:
@@ -62,10 +135,10 @@ class GillespieSystem(System):
         format (index, delta).  Delta for e.g. is usually +1 or -1.
 
         process_update_list is a list (same size as the quantity vector)
-        with the elements being lists of processes that a given quantity 
-        is involved in.  It is used to make the Gillespie propagator 
-        more efficient, only updating the processes that have changed after 
-        each reaction.
+        with the elements being lists of processes whose propensities
+        depend on a given quantity.  It is used to make the Gillespie
+        propagator more efficient, only recomputing the propensities
+        that can actually have changed after each reaction.
 
         Returns:
 
@@ -73,10 +146,23 @@ class GillespieSystem(System):
         """
         processes = []
         for c in self.model.compartments.values():
-            # first add reactions 
+            # hoist the per-compartment index map and volume out of the
+            # reaction loops; the two-level dict traversal otherwise
+            # repeats once per reactant and once per product
+            idx_map = self.state.index[c.ID]
+            vol = c.volume
+            # pint exponentiation builds a fresh Quantity and
+            # re-resolves units every call, so the volume factor for
+            # each reaction order is computed once per compartment
+            vol_facs = {}
+
+            # first add reactions
             for r in c.reactions:
+                sr = r.stoich_r
+                sp = r.stoich_p
+
                 # add forward reaction (losing reactants, gaining products)
-                
+
                 if r.kf > 0:
                     # qlist: quantities that must be multiplied together to
                     # get the reaction flux
@@ -85,14 +171,17 @@ class GillespieSystem(System):
                     vol_fac = 1
                     n_r = 0
                     for j,x in enumerate(r.reactants):
-                        q_list.append((self.state.index[c.ID][x.ID],r.stoich_r[j]))
-                        delta_list.append((self.state.index[c.ID][x.ID],-r.stoich_r[j]))
-                        n_r += r.stoich_r[j]
-                    if c.volume is not None and n_r - 1 > 0:
-                        vol_fac = (c.volume/unit.mol)**(n_r-1)
+                        q_list.append((idx_map[x.ID],sr[j]))
+                        delta_list.append((idx_map[x.ID],-sr[j]))
+                        n_r += sr[j]
+                    if vol is not None and n_r - 1 > 0:
+                        vol_fac = vol_facs.get(n_r)
+                        if vol_fac is None:
+                            vol_fac = (vol/unit.mol)**(n_r-1)
+                            vol_facs[n_r] = vol_fac
 
                     for j,x in enumerate(r.products):
-                        delta_list.append((self.state.index[c.ID][x.ID],r.stoich_p[j]))
+                        delta_list.append((idx_map[x.ID],sp[j]))
 
                     processes.append((self._cast_rate(r.kf/vol_fac),q_list,delta_list))
 
@@ -103,31 +192,40 @@ class GillespieSystem(System):
                     vol_fac = 1
                     n_r = 0
                     for j,x in enumerate(r.reactants):
-                        delta_list.append((self.state.index[c.ID][x.ID],r.stoich_r[j]))
+                        delta_list.append((idx_map[x.ID],sr[j]))
 
                     for j,x in enumerate(r.products):
-                        delta_list.append((self.state.index[c.ID][x.ID],-r.stoich_p[j]))
-                        q_list.append((self.state.index[c.ID][x.ID],r.stoich_p[j]))
-                        n_r += r.stoich_p[j]
-                    if c.volume is not None and n_r - 1 > 0:
-                        vol_fac = (c.volume/unit.mol)**(n_r-1)
+                        delta_list.append((idx_map[x.ID],-sp[j]))
+                        q_list.append((idx_map[x.ID],sp[j]))
+                        n_r += sp[j]
+                    if vol is not None and n_r - 1 > 0:
+                        vol_fac = vol_facs.get(n_r)
+                        if vol_fac is None:
+                            vol_fac = (vol/unit.mol)**(n_r-1)
+                            vol_facs[n_r] = vol_fac
 
                     processes.append((self._cast_rate(r.kr/vol_fac),q_list,delta_list))
 
-            # then, add diffusion processes
+            # then, add diffusion processes; the pint division by
+            # volume is hoisted to a single reciprocal per compartment
+            # (Quantity division constructs a new object and
+            # re-resolves units on every call)
+            vol_inv = None if vol is None else 1.0/vol
             for other_lab, conn in c.connections.items():
-                for s in conn[1].species_rates.keys():
+                other_idx = self.state.index[other_lab]
+                is_divbyv = isinstance(conn[1],DivByVConnection)
+                for s,(r_out,r_in) in conn[1].species_rates.items():
                     # add "out" diffusion process
                     # Note: volumes must be defined if diffusion processes are occurring
                     #
-                    if isinstance(conn,DivByVConnection):
-                        processes.append((self._cast_rate(conn[1].species_rates[s][0]/c.volume),
-                                          [(self.state.index[c.ID][s],1)],
-                                          [(self.state.index[c.ID][s],-1), (self.state.index[other_lab][s],1)]))
+                    if is_divbyv:
+                        processes.append((self._cast_rate(r_out*vol_inv),
+                                          [(idx_map[s],1)],
+                                          [(idx_map[s],-1), (other_idx[s],1)]))
                     else:
-                        processes.append((self._cast_rate(conn[1].species_rates[s][0]),
-                                          [(self.state.index[c.ID][s],1)],
-                                          [(self.state.index[c.ID][s],-1), (self.state.index[other_lab][s],1)]))
+                        processes.append((self._cast_rate(r_out),
+                                          [(idx_map[s],1)],
+                                          [(idx_map[s],-1), (other_idx[s],1)]))
                         
 
 #                    if isinstance(conn[0],Reservoir):
@@ -136,11 +234,16 @@ class GillespieSystem(System):
 #                                          [(self.state.index[c.ID][s],-1), (self.state.index[other_lab][s],1)]))
                         
 
-            process_update_list = [[] for idx in range(self.state.size)]
-            for i,p in enumerate(processes):
-                for ID,delta in p[2]:
-                    process_update_list[ID].append(i)
-                                     
+        # map each quantity to the processes whose propensity reads it
+        # (the q_list), not to every process that writes it: after a
+        # firing only the readers of the changed species need their
+        # propensities recomputed, so building from the delta lists
+        # would fan out to product-sharing reactions for no reason
+        process_update_list = [[] for idx in range(self.state.size)]
+        for i,p in enumerate(processes):
+            for ID,num in p[1]:
+                process_update_list[ID].append(i)
+
         return processes, process_update_list
 
     def set_q(self,idxs,Q):
@@ -164,8 +267,19 @@ class GillespieSystem(System):
 
     def _cast_rate(self,rate):
         # checks rates to make sure they are in the correct units (1/s), and then
-        # strips the units away
+        # strips the units away.  Results are memoized by object
+        # identity: resolved connections share one rate table across
+        # many edges, so the same Quantity arrives here repeatedly and
+        # pint's unit resolution only needs to run once per object.
+        # The cached Quantity stays referenced, so its id cannot be
+        # recycled by the allocator while the entry lives.
+
+        cached = self._rate_cache.get(id(rate))
+        if cached is not None and cached[0] is rate:
+            return cached[1]
 
         rate.ito(1/unit.sec)
-        
-        return rate.magnitude
+        mag = rate.magnitude
+        self._rate_cache[id(rate)] = (rate,mag)
+
+        return mag
@@ -4,7 +4,7 @@ scipy's solve_idp function."""
 
 from openrxn import unit
 from openrxn.systems.state import State
-from openrxn.systems.deriv import DerivFuncBuilder
+from openrxn.systems.deriv import DerivFuncBuilder, CompiledDeriv
 from openrxn.systems.system import System
 from openrxn.compartments.compartment import Reservoir
 from openrxn.connections import DivByVConnection
@@ -17,12 +17,31 @@ EPSILON = 1e-8
 
 class ODESystem(System):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, dtype=np.float64, **kwargs):
+        """dtype sets the precision of the state vector and the
+        compiled rate/transport arrays.  np.float32 halves the
+        memory traffic of large models; for those runs, pair it
+        with looser tolerances (e.g. rtol=1e-5, atol=1e-6)."""
 
         super().__init__(*args,**kwargs)
         self.NA = 6.022e23
-        
-        self.dqdt = self._build_dqdt()
+        self.dtype = dtype
+
+        # the derivative-term traversal only depends on the model, so
+        # cache it there: building many systems from the same
+        # FlatModel (e.g. parameter sweeps over initial conditions)
+        # pays the cost once.  As with _compiled_processes, the cache
+        # goes stale if the model is modified after the first system
+        # is built.
+        cached = getattr(self.model,'_compiled_dqdt',None)
+        if cached is None:
+            self.dqdt = self._build_dqdt()
+            self.model._compiled_dqdt = self.dqdt
+        else:
+            self.dqdt = cached
+        self.compiled_deriv = CompiledDeriv(self.dqdt,dtype=dtype)
+        if dtype != self.state.q_val.dtype:
+            self.state.q_val = self.state.q_val.astype(dtype)
 
     def set_q(self,idxs,Q):
         """Set the state.q_val array at the specified indexes
@@ -94,120 +113,213 @@ class ODESystem(System):
         the concentration of the reservoir, given time as an input.
 
         Inputs:
-        
+
         state : openrxn.systems.state.State object
         model : openrxn.model.FlatModel object
         """
-        dqdt = []
-        for i in range(self.state.size):
-            # collect source and sink terms for this species in this compartment
-
-            c = self.model.compartments[self.state.compartment[i]]
-            s = self.state.species[i]
-
-            sources = []
-            sources_reservoir = []
-            sinks = []
-            
-            # look through the reactions in this compartment for ones that
-            # involve this species
+        sources = [[] for i in range(self.state.size)]
+        sinks = [[] for i in range(self.state.size)]
+        sources_reservoir = [[] for i in range(self.state.size)]
+
+        for c_tag,spec_map in self.state.index.items():
+            c = self.model.compartments[c_tag]
+            vol = c.volume
+            # pint exponentiation builds a fresh Quantity and
+            # re-resolves units every call, so the volume factor for
+            # each reaction order is computed once per compartment
+            vol_facs = {}
+
+            # walk each reaction once, computing its rate and q_list
+            # a single time, and fan the terms out to every species
+            # it touches (the old species-major loop rebuilt them for
+            # each participant, O(reactions x species) overall)
             for r in c.reactions:
-                if s in r.reactant_IDs:
-                    s_idx = r.reactant_IDs.index(s)
-                    if r.kf > 0:
-                        # append forward reaction to sinks
-                        q_list = []
-                        n_r = 0
-                        for j,x in enumerate(r.reactants):
-                            q_list += [self.state.index[c.ID][x.ID]]*r.stoich_r[j]
-                            n_r += r.stoich_r[j]
-                        if n_r - 1 > 0 and c.volume is not None:
-                            vol_fac = (self.NA*c.volume/unit.mol)**(n_r-1)
-                            rate = r.kf/vol_fac
-                        else:
-                            rate = r.kf
-                        sinks.append((rate, q_list, r.stoich_r[s_idx]))
-                    if r.kr > 0:
-                        # append reverse reaction to sources
-                        q_list = []
-                        n_p = 0
-                        for j,x in enumerate(r.products):
-                            q_list += [self.state.index[c.ID][x.ID]]*r.stoich_p[j]
-                            n_p += r.stoich_p[j]
-                        if n_p - 1 > 0 and c.volume is not None:
-                            vol_fac = (self.NA*c.volume/unit.mol)**(n_p-1)
-                            rate = r.kr/vol_fac
-                        else:
-                            rate = r.kr
-                        sources.append((rate, q_list, r.stoich_r[s_idx]))
-                    
-                if s in r.product_IDs:
-                    s_idx = r.product_IDs.index(s)
-                    if r.kf > 0:
-                        # append forward reaction to sources
-                        q_list = []
-                        n_r = 0
-                        for j,x in enumerate(r.reactants):
-                            q_list += [self.state.index[c.ID][x.ID]]*r.stoich_r[j]
-                            n_r += r.stoich_r[j]
-                        if n_r - 1 > 0 and c.volume is not None:
-                            vol_fac = (self.NA*c.volume/unit.mol)**(n_r-1)
-                            rate = r.kf/vol_fac
-                        else:
-                            rate = r.kf
-                        sources.append((rate, q_list, r.stoich_p[s_idx]))
-
-                    if r.kr > 0:
-                        # append reverse reaction to sinks
-                        q_list = []
-                        n_p = 0
-                        for j,x in enumerate(r.products):
-                            q_list += [self.state.index[c.ID][x.ID]]*r.stoich_p[j]
-                            n_p += r.stoich_p[j]
-                        if n_p - 1 > 0 and c.volume is not None:
-                            vol_fac = (self.NA*c.volume/unit.mol)**(n_p-1)
-                            rate = r.kr/vol_fac
-                        else:
-                            rate = r.kr
-                        sinks.append((rate, q_list, r.stoich_p[s_idx]))
+                # hoist the stoichiometry lists into locals; the
+                # attribute+index chains below otherwise repeat per
+                # participant
+                sr = r.stoich_r
+                sp = r.stoich_p
 
-            # look through connections for those that involve this species
+                if r.kf > 0:
+                    q_list = []
+                    n_r = 0
+                    for j,x in enumerate(r.reactants):
+                        q_list += [spec_map[x.ID]]*sr[j]
+                        n_r += sr[j]
+                    if n_r - 1 > 0 and vol is not None:
+                        vol_fac = vol_facs.get(n_r)
+                        if vol_fac is None:
+                            vol_fac = (self.NA*vol/unit.mol)**(n_r-1)
+                            vol_facs[n_r] = vol_fac
+                        rate = r.kf/vol_fac
+                    else:
+                        rate = r.kf
+                    # forward reaction: sink for reactants, source
+                    # for products
+                    for j,x in enumerate(r.reactants):
+                        sinks[spec_map[x.ID]].append((rate, q_list, sr[j]))
+                    for j,x in enumerate(r.products):
+                        sources[spec_map[x.ID]].append((rate, q_list, sp[j]))
+
+                if r.kr > 0:
+                    q_list = []
+                    n_p = 0
+                    for j,x in enumerate(r.products):
+                        q_list += [spec_map[x.ID]]*sp[j]
+                        n_p += sp[j]
+                    if n_p - 1 > 0 and vol is not None:
+                        vol_fac = vol_facs.get(n_p)
+                        if vol_fac is None:
+                            vol_fac = (self.NA*vol/unit.mol)**(n_p-1)
+                            vol_facs[n_p] = vol_fac
+                        rate = r.kr/vol_fac
+                    else:
+                        rate = r.kr
+                    # reverse reaction: source for reactants, sink
+                    # for products
+                    for j,x in enumerate(r.reactants):
+                        sources[spec_map[x.ID]].append((rate, q_list, sr[j]))
+                    for j,x in enumerate(r.products):
+                        sinks[spec_map[x.ID]].append((rate, q_list, sp[j]))
+
+            # look through connections, one pass per edge and species;
+            # the pint division by volume is hoisted to a single
+            # reciprocal per compartment (Quantity division constructs
+            # a new object and re-resolves units on every call)
+            vol_inv = None if vol is None else 1.0/vol
             for other_lab, conn in c.connections.items():
-                if s in conn[1].species_rates:
-                                  
+                other = self.model.compartments[other_lab]
+                other_is_res = isinstance(other,Reservoir)
+                is_divbyv = isinstance(conn[1],DivByVConnection)
+                if not other_is_res:
+                    other_idx = self.state.index[other_lab]
+                for s,(r_out,r_in) in conn[1].species_rates.items():
+                    if s not in spec_map:
+                        continue
+                    i = spec_map[s]
+
                     # add "out" diffusion process
-                    if isinstance(conn,DivByVConnection):
-                        sinks.append((conn[1].species_rates[s][0]/c.volume, [i], 1))
+                    if is_divbyv:
+                        sinks[i].append((r_out*vol_inv, [i], 1))
                     else:
-                        sinks.append((conn[1].species_rates[s][0], [i], 1))
+                        sinks[i].append((r_out, [i], 1))
 
                     # add "in" diffusion process
-                    if isinstance(self.model.compartments[other_lab],Reservoir):
-                        sources_reservoir.append((conn[1].species_rates[s][1],
-                                        self.model.compartments[other_lab].conc_funcs[s],
+                    if other_is_res:
+                        sources_reservoir[i].append((r_in,
+                                        other.conc_funcs[s],
                                         1))
                     else:
-                        if isinstance(conn,DivByVConnection):
-                            sources.append((conn[1].species_rates[s][1]/conn[0].volume,
-                                            [self.state.index[other_lab][s]],
+                        if is_divbyv:
+                            sources[i].append((r_in/conn[0].volume,
+                                            [other_idx[s]],
                                             1))
                         else:
-                            sources.append((conn[1].species_rates[s][1],
-                                            [self.state.index[other_lab][s]],
+                            sources[i].append((r_in,
+                                            [other_idx[s]],
                                             1))
-                    
-            dqdt.append(DerivFuncBuilder(sources, sinks, sources_reservoir))
 
-        return dqdt
+        return [DerivFuncBuilder(sources[i], sinks[i], sources_reservoir[i])
+                for i in range(self.state.size)]
                             
     def _dQ_dt(self,t,Q):
-        return np.array([builder.deriv_func(Q,t) for builder in self.dqdt])
+        return self.compiled_deriv.deriv_all(Q,t)
+
+    def _jac(self,t,Q):
+        return self.compiled_deriv.jac_all(Q,t)
+
+    def _jac_sparse(self,t,Q):
+        return self.compiled_deriv.jac_sparse_all(Q,t)
     
+    def run_julia(self,total_time,solver='FBDF',abstol=1e-9,reltol=1e-9,**kwargs):
+        """Integrates the system with the Julia DifferentialEquations.jl
+        solvers through diffeqpy, which can outperform solve_ivp on
+        stiff reaction-diffusion systems.  Requires the optional
+        diffeqpy package (and a Julia installation).
+
+        solver is the name of a DifferentialEquations.jl solver
+        (e.g. 'FBDF', 'Rodas5').  Other keyword arguments are passed
+        to de.solve.
+
+        Note that this path integrates in one shot: reporters are not
+        called, but the full solution object is returned and
+        state.q_val is updated to the final time point.
+        """
+        try:
+            from diffeqpy import de
+        except ImportError:
+            raise ImportError("Error! run_julia requires the diffeqpy package "
+                              "(pip install diffeqpy)")
+
+        def f(y,p,t):
+            return self.compiled_deriv.deriv_all(y,t)
+
+        prob = de.ODEProblem(f,self.state.q_val,(0.0,float(total_time)))
+        sol = de.solve(prob,getattr(de,solver)(),abstol=abstol,reltol=reltol,**kwargs)
+
+        self.state.q_val = np.array(sol.u[-1])
+
+        return sol
+
+    def run_cvode(self,total_time,rtol=1e-9,atol=1e-9,**kwargs):
+        """Integrates the system with the SUNDIALS CVODE solver
+        through scikits.odes, which avoids solve_ivp's per-step
+        Python bookkeeping and can be markedly faster on stiff
+        mass-action networks.  Requires the optional scikits.odes
+        package (and a SUNDIALS installation).
+
+        Other keyword arguments are passed to the scikits.odes ode
+        constructor.
+
+        As with run_julia, this path integrates in one shot:
+        reporters are not called, but the solution object is
+        returned and state.q_val is updated to the final time point.
+        """
+        try:
+            from scikits.odes import ode
+        except ImportError:
+            raise ImportError("Error! run_cvode requires the scikits.odes package "
+                              "(pip install scikits.odes)")
+
+        def rhs(t,y,ydot):
+            ydot[:] = self.compiled_deriv.deriv_all(y,t)
+
+        solver = ode('cvode',rhs,old_api=False,rtol=rtol,atol=atol,**kwargs)
+        sol = solver.solve([0.0,float(total_time)],self.state.q_val)
+
+        self.state.q_val = np.array(sol.values.y[-1])
+
+        return sol
+
     def propagate(self,t_interval,**kwargs):
         """For ODE systems, propagate directly calls the scipy
-        solve_ivp function.  state.q_val is also updated."""
+        solve_ivp function.  state.q_val is also updated.
+
+        Reaction-diffusion systems are typically stiff, so the
+        default method is LSODA, supplied with the analytic
+        Jacobian from the compiled derivative terms (instead of
+        letting the solver build one by finite differences).
+        BDF and Radau accept sparse Jacobians, so they get the
+        fixed-pattern CSR form, which avoids the O(N^2) dense
+        matrix on large models.  Both can be overridden through
+        kwargs."""
+
+        kwargs.setdefault('method','LSODA')
+        if self.dtype == np.float32:
+            # float32 carries ~7 digits; asking the solver for the
+            # float64 default tolerances would just make it grind
+            kwargs.setdefault('rtol',1e-4)
+            kwargs.setdefault('atol',1e-4)
+        if 'jac' not in kwargs:
+            if kwargs['method'] in ['BDF','Radau']:
+                kwargs['jac'] = self._jac_sparse
+            elif kwargs['method'] == 'LSODA':
+                kwargs['jac'] = self._jac
 
         result = solve_ivp(self._dQ_dt,t_interval,self.state.q_val,**kwargs)
-        self.state.q_val = result.y[:,-1]
+        # solve_ivp integrates in float64 regardless of the input
+        # dtype, so the final state is cast back to keep float32
+        # runs float32 between checkpoints
+        self.state.q_val = result.y[:,-1].astype(self.dtype,copy=False)
         
         return result
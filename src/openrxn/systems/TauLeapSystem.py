@@ -0,0 +1,36 @@
+"""Tau-leaping systems have discrete values for species quantities,
+like Gillespie systems, but are propagated with the approximate
+tau-leaping algorithm: all reactions that fire within a leap are
+drawn together from Poisson distributions.  This is much faster
+than the exact direct method when populations (and therefore firing
+counts per leap) are high.
+
+The process representation is shared with GillespieSystem.
+"""
+
+from openrxn.systems.GillespieSystem import GillespieSystem
+from openrxn.propagators import TauLeap
+
+class TauLeapSystem(GillespieSystem):
+    """A GillespieSystem propagated with tau-leaping.
+
+    epsilon controls the leap-size selection: the expected relative
+    change of each quantity within one leap is bounded by epsilon
+    (0.03 is the conventional choice).
+    """
+
+    def __init__(self, *args, epsilon=0.03, **kwargs):
+
+        super().__init__(*args,**kwargs)
+        self.epsilon = epsilon
+
+    def propagate(self,t_interval,**kwargs):
+        """
+        Interfaces with openrxn.propagators.TauLeap()
+        """
+
+        new_q, final_t = TauLeap(self.packed_processes,t_interval,
+                                 self.state.q_val,epsilon=self.epsilon)
+        self.state.q_val = new_q
+
+        return {'new_q': new_q, 'final_t': final_t}
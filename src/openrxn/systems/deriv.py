@@ -3,12 +3,19 @@ Derivative function builders take a list of sources and sinks
 upon initialization.  Their self.deriv_func functions are used
 by the integrator to move the system forward in time.
 
-Rate constants given to DerivFuncBuilder are assumed to be 
+Rate constants given to DerivFuncBuilder are assumed to be
 in units of 1/s.  Units are stripped upon initialization.
+
+CompiledDeriv collects the terms from a full list of
+DerivFuncBuilder objects into flat numpy arrays, so that the
+whole right-hand side can be evaluated in a single Numba-compiled
+kernel instead of one Python call per quantity.
 """
 
 from openrxn import unit
 import numpy as np
+from numba import njit
+from scipy import sparse
 
 class DerivFuncBuilder(object):
     """
@@ -31,22 +38,212 @@ class DerivFuncBuilder(object):
         for s in sources:
             pref = s[0].to(1/unit.sec).magnitude*s[2]
             if pref > 0:
-                self.terms.append((pref,s[1]))
-                
+                self.terms.append((pref,tuple(s[1])))
+
         for s in sinks:
             pref = s[0].to(1/unit.sec).magnitude*s[2]
             if pref > 0:
-                self.terms.append((-pref,s[1]))
+                self.terms.append((-pref,tuple(s[1])))
 
         self.sources_reservoir = [(s[0].to(unit.nm**3/unit.sec).magnitude*s[2], s[1]) for s in sources_reservoir]
         
     def deriv_func(self,Q,t):
-        dqdt = 0
-        for tup in self.terms:
-            dqdt += tup[0]*np.prod(Q[tup[1]])
+        dqdt = 0.
+        for pref,inds in self.terms:
+            # reactant lists are 1-3 entries; a scalar multiply loop
+            # beats the fancy-index gather plus np.prod reduction
+            # that would allocate a fresh array per term
+            tmp = pref
+            for i in inds:
+                tmp *= Q[i]
+            dqdt += tmp
         for tup in self.sources_reservoir:
             dqdt += tup[0] * tup[1](t)
         return dqdt
 
+@njit(cache=True, fastmath=True)
+def _rhs_kernel(Q, pref, target, q_idx, q_ptr, dQ):
+    dQ[:] = 0.0
+    for j in range(pref.shape[0]):
+        p = pref[j]
+        for m in range(q_ptr[j], q_ptr[j+1]):
+            p *= Q[q_idx[m]]
+        dQ[target[j]] += p
+    return dQ
+
+@njit(cache=True, fastmath=True)
+def _jac_sparse_kernel(Q, pref, q_idx, q_ptr, pos, data):
+    # same differentiation as _jac_kernel, but each contribution is
+    # accumulated straight into its precomputed slot in the CSR data
+    # array instead of a dense (N,N) matrix
+    for j in range(pref.shape[0]):
+        i0 = q_ptr[j]
+        i1 = q_ptr[j+1]
+        for m in range(i0, i1):
+            p = pref[j]
+            for mm in range(i0, i1):
+                if mm != m:
+                    p *= Q[q_idx[mm]]
+            data[pos[m]] += p
+    return data
+
+@njit(cache=True, fastmath=True)
+def _jac_kernel(Q, pref, target, q_idx, q_ptr, jac):
+    jac[:,:] = 0.0
+    for j in range(pref.shape[0]):
+        i0 = q_ptr[j]
+        i1 = q_ptr[j+1]
+        # differentiate the product term with respect to each
+        # of its factors in turn
+        for m in range(i0, i1):
+            p = pref[j]
+            for mm in range(i0, i1):
+                if mm != m:
+                    p *= Q[q_idx[mm]]
+            jac[target[j], q_idx[m]] += p
+    return jac
+
+class CompiledDeriv(object):
+    """Flattens the terms of a list of DerivFuncBuilder objects
+    (one per quantity in the state vector) into structure-of-arrays
+    form:
+
+    pref[j]     prefactor of term j (signed; sinks are negative)
+    target[j]   index of the quantity that term j contributes to
+    q_idx, q_ptr   CSR-style storage of the Q indexes to multiply
+                   for each term
+
+    deriv_all evaluates all the terms with a single Numba kernel.
+    Reservoir sources involve Python-level concentration functions,
+    so they are evaluated outside the kernel and added afterwards.
+
+    jac_all evaluates the (dense) Jacobian of the right-hand side,
+    which can be passed to implicit integrators; jac_sparse_all
+    evaluates the same Jacobian into a fixed-pattern CSR matrix.
+    """
+
+    def __init__(self, builders, dtype=np.float64):
+        self.size = len(builders)
+        self.dtype = dtype
+
+        pref = []
+        target = []
+        q_idx = []
+        q_ptr = [0]
+        lin_row = []
+        lin_col = []
+        lin_val = []
+        res_terms = []
+        for i,b in enumerate(builders):
+            for p,inds in b.terms:
+                if len(inds) == 1:
+                    # terms that are linear in Q (diffusion between
+                    # compartments, first-order reactions) are collected
+                    # into a sparse matrix and applied as a single
+                    # matrix-vector product
+                    lin_row.append(i)
+                    lin_col.append(inds[0])
+                    lin_val.append(p)
+                else:
+                    pref.append(p)
+                    target.append(i)
+                    q_idx += list(inds)
+                    q_ptr.append(len(q_idx))
+            for p,func in b.sources_reservoir:
+                res_terms.append((p,func,i))
+
+        self.pref = np.array(pref,dtype=dtype)
+        self.target = np.array(target,dtype=np.int64)
+        self.q_idx = np.array(q_idx,dtype=np.int64)
+        self.q_ptr = np.array(q_ptr,dtype=np.int64)
+        self.linear = sparse.csr_matrix((lin_val,(lin_row,lin_col)),
+                                        shape=(self.size,self.size),
+                                        dtype=dtype)
+        # with the species-major state layout each species' Laplacian
+        # is a contiguous diagonal block; sorting the column indices
+        # keeps the matvec walking memory in order
+        self.linear.sum_duplicates()
+        self.linear.sort_indices()
+
+        # reservoir sources with fixed concentrations (tagged by
+        # Reservoir with a constant attribute) contribute a
+        # time-independent vector, precomputed here; only genuinely
+        # time-varying conc_funcs stay as per-call Python functions
+        self._res_const = np.zeros(self.size,dtype=dtype)
+        self.res_terms = []
+        for p,func,i in res_terms:
+            conc = getattr(func,'constant',None)
+            if conc is not None:
+                self._res_const[i] += p*getattr(conc,'magnitude',conc)
+            else:
+                self.res_terms.append((p,func,i))
+        self._has_res_const = bool(self._res_const.any())
+
+        self._dQ = np.zeros(self.size,dtype=dtype)
+        self._jac = np.zeros((self.size,self.size),dtype=dtype)
+        self._linear_dense = self.linear.toarray()
+
+        # the Jacobian sparsity pattern is fixed by the terms, so the
+        # CSR structure is built once here; jac_sparse_all only refills
+        # the data array.  Each term factor's slot in that array is
+        # precomputed, as are the slots of the linear-part entries.
+        rows = np.repeat(self.target,np.diff(self.q_ptr))
+        cols = self.q_idx
+        pattern = sparse.csr_matrix((np.ones(cols.shape[0]),(rows,cols)),
+                                    shape=(self.size,self.size))
+        pattern = ((pattern + abs(self.linear)) != 0).tocsr()
+        pattern.sort_indices()
+        self.jac_pattern = pattern
+
+        def positions(r,c):
+            pos = np.empty(len(r),dtype=np.int64)
+            for k in range(len(r)):
+                lo = pattern.indptr[r[k]]
+                hi = pattern.indptr[r[k]+1]
+                pos[k] = lo + np.searchsorted(pattern.indices[lo:hi],c[k])
+            return pos
+
+        self._contrib_pos = positions(rows,cols)
+        lin_coo = self.linear.tocoo()
+        self._lin_pos = positions(lin_coo.row,lin_coo.col)
+        self._lin_data = lin_coo.data.astype(dtype)
+        self._jac_sdata = np.zeros(pattern.nnz,dtype=dtype)
+        self._jac_sparse = sparse.csr_matrix(
+            (self._jac_sdata,pattern.indices,pattern.indptr),
+            shape=(self.size,self.size))
+
+    def deriv_all(self,Q,t):
+        dQ = _rhs_kernel(Q, self.pref, self.target, self.q_idx, self.q_ptr, self._dQ)
+        dQ += self.linear.dot(Q)
+        if self._has_res_const:
+            dQ += self._res_const
+        for p,func,i in self.res_terms:
+            conc = func(t)
+            if hasattr(conc,'magnitude'):
+                conc = conc.magnitude
+            dQ[i] += p*conc
+        return dQ
+
+    def jac_all(self,Q,t):
+        # reservoir sources do not depend on Q, so they do not
+        # contribute to the Jacobian
+        jac = _jac_kernel(Q, self.pref, self.target, self.q_idx, self.q_ptr, self._jac)
+        jac += self._linear_dense
+        return jac
+
+    def jac_sparse_all(self,Q,t):
+        """Like jac_all, but returns a scipy CSR matrix with the
+        precomputed sparsity pattern (see jac_pattern).  For large
+        models this avoids the O(N^2) dense matrix entirely; suitable
+        for the solve_ivp methods that accept sparse Jacobians
+        (BDF, Radau)."""
+
+        data = self._jac_sdata
+        data[:] = 0.0
+        _jac_sparse_kernel(Q, self.pref, self.q_idx, self.q_ptr,
+                           self._contrib_pos, data)
+        data[self._lin_pos] += self._lin_data
+        return self._jac_sparse
+
 
     
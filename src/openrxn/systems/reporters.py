@@ -2,12 +2,23 @@
 what information is retained and attached to system.results
 during system dynamics."""
 
+from collections import namedtuple
+
 import numpy as np
 
+Reports = namedtuple('Reports',['t','y'])
+
 class Reporter(object):
-    """Base class for Reporters"""
+    """Base class for Reporters.
+
+    Reports are stored in preallocated numpy arrays (grown
+    geometrically when needed) rather than a list of per-step
+    dicts, which keeps reporting allocation-free in steady state
+    and returns cache-friendly contiguous storage.  Subclasses
+    record one row per report through _record.
+    """
 
-    def __init__(self, freq=None):
+    def __init__(self, freq=None, capacity=16):
         """The following attributes are necessary for Reporter
         objects.
 
@@ -15,124 +26,228 @@ class Reporter(object):
         the frequency with which results are reported
         as measured in number of timesteps
 
+        capacity:  int
+        initial number of reports the storage is sized for;
+        it doubles whenever it fills
         """
         self.freq = freq
-        self._reports = []
+        self.capacity = max(capacity,1)
+        self._n = 0
+        self._t = None
+        self._y = None
+        self._buf = None
+
+    def _gather(self,current_state_vec,idxs):
+        """Gathers the selected entries of the state vector into a
+        reusable buffer with np.take, so reporting a subselection
+        allocates nothing in steady state.  The buffer is overwritten
+        on every call; _record copies it into the report storage."""
+
+        buf = self._buf
+        if buf is None or buf.dtype != current_state_vec.dtype:
+            buf = self._buf = np.empty(idxs.shape[0],current_state_vec.dtype)
+        np.take(current_state_vec,idxs,out=buf)
+        return buf
+
+    def _record(self,current_time,value):
+        """Stores one report row.  value can be a scalar or a 1D
+        array; its length fixes the row width on the first call."""
+
+        value = np.atleast_1d(value)
+        if self._y is None:
+            self._t = np.empty(self.capacity)
+            self._y = np.empty((self.capacity,value.shape[0]))
+        elif self._n >= self._y.shape[0]:
+            new_cap = 2*self._y.shape[0]
+            self._t = np.resize(self._t,new_cap)
+            self._y = np.resize(self._y,(new_cap,self._y.shape[1]))
+
+        self._t[self._n] = current_time
+        self._y[self._n] = value
+        self._n += 1
 
     def report(self,current_time,current_state_vec):
         """Function for returning results that are attached
-        to system.results.  current_state_vec is the state vector 
+        to system.results.  current_state_vec is the state vector
         of the system."""
 
         return NotImplementedError
 
     def reports(self):
-        """Return the list of reports that have been collected."""
+        """Return the collected reports as a Reports namedtuple of
+        arrays: t has shape (n_reports,) and y has shape
+        (n_reports, width), so reports can be sliced without any
+        per-report Python objects (e.g. reports.y[:,0])."""
 
-        return self._reports
+        if self._y is None:
+            return Reports(np.empty(0),np.empty((0,0)))
+        return Reports(self._t[:self._n],self._y[:self._n])
 
 class AllReporter(Reporter):
-    """Reports the entire state_vec at some specified frequency."""
+    """Reports the entire state_vec at some specified frequency.
 
-    def __init__(self, freq=1):
-        super().__init__(freq=freq)
+    nsteps_hint : int
+    Optional hint for the number of snapshots that will be taken,
+    used to size the arrays up front.
+    """
+
+    def __init__(self, freq=1, nsteps_hint=16):
+        super().__init__(freq=freq,capacity=nsteps_hint)
 
     def report(self,current_time,current_state_vec):
-        self._reports.append({'t': current_time,
-                              'report': current_state_vec})
+        self._record(current_time,current_state_vec)
 
 class SelectionReporter(Reporter):
     """Reports a subsection of the full state_vec at some specified
     frequency.
-    
+
     selection_idxs : list of int
-    A list of indexes to report.  This needs to be compatible 
+    A list of indexes to report.  This needs to be compatible
     with the elements of the system.state.q_vec vector.
     """
 
     def __init__(self, selection_idxs, freq=1):
-        self.selection_idxs = selection_idxs
+        # converting the indexes to an intp array once avoids the
+        # list-to-array fancy-index conversion on every report call
+        self.selection_idxs = np.ascontiguousarray(selection_idxs,dtype=np.intp)
         super().__init__(freq=freq)
 
     def report(self,current_time,current_state_vec):
-        self._reports.append({'t': current_time,
-                              'report': current_state_vec[self.selection_idxs]})
+        self._record(current_time,self._gather(current_state_vec,self.selection_idxs))
 
 class SumReporter(Reporter):
-    """Reports the sum of values for a subselection of the 
+    """Reports the sum of values for a subselection of the
     full state_vec at some specified frequency.
-    
+
     selection_idxs : list of int
-    A list of indexes to report.  This needs to be compatible 
+    A list of indexes to report.  This needs to be compatible
     with the elements of the system.state.q_vec vector.
     """
 
     def __init__(self, selection_idxs, freq=1):
-        self.selection_idxs = selection_idxs
+        self.selection_idxs = np.ascontiguousarray(selection_idxs,dtype=np.intp)
         super().__init__(freq=freq)
 
     def report(self,current_time,current_state_vec):
-        self._reports.append({'t': current_time,
-                              'report': np.sum(current_state_vec[self.selection_idxs])})
+        self._record(current_time,
+                     self._gather(current_state_vec,self.selection_idxs).sum())
 
 class AvgReporter(Reporter):
-    """Reports the average of values for a subselection of the 
+    """Reports the average of values for a subselection of the
     full state_vec at some specified frequency.
-    
+
     selection_idxs : list of int
-    A list of indexes to report.  This needs to be compatible 
+    A list of indexes to report.  This needs to be compatible
     with the elements of the system.state.q_vec vector.
     """
 
     def __init__(self, selection_idxs, freq=1):
-        self.selection_idxs = selection_idxs
+        self.selection_idxs = np.ascontiguousarray(selection_idxs,dtype=np.intp)
         super().__init__(freq=freq)
 
     def report(self,current_time,current_state_vec):
-        self._reports.append({'t': current_time,
-                              'report': np.sum(current_state_vec[self.selection_idxs])/len(self.selection_idxs)})
+        self._record(current_time,
+                     self._gather(current_state_vec,self.selection_idxs).sum()
+                     /len(self.selection_idxs))
 
 class MaxReporter(Reporter):
-    """Reports the maxmimum value over a subselection of the 
+    """Reports the maxmimum value over a subselection of the
     full state_vec variables at some specified frequency.
-    
+
     selection_idxs : list of int
-    A list of indexes to report.  This needs to be compatible 
+    A list of indexes to report.  This needs to be compatible
     with the elements of the system.state.q_vec vector.
 
-    returns:
-
-    (max, argmax)
+    Each report row holds two columns: (max, argmax).
     """
 
     def __init__(self, selection_idxs, freq=1):
-        self.selection_idxs = selection_idxs
+        self.selection_idxs = np.ascontiguousarray(selection_idxs,dtype=np.intp)
         super().__init__(freq=freq)
 
     def report(self,current_time,current_state_vec):
-        tmp = current_state_vec[self.selection_idxs]
-        self._reports.append({'t': current_time,
-                              'report': (np.max(tmp),np.argmax(tmp))})
+        # locate the extremum once and index it, rather than
+        # scanning the selection a second time for its value
+        tmp = self._gather(current_state_vec,self.selection_idxs)
+        idx = np.argmax(tmp)
+        self._record(current_time,(tmp[idx],idx))
 
 class MinReporter(Reporter):
-    """Reports the minimum value over a subselection of the 
+    """Reports the minimum value over a subselection of the
     full state_vec at some specified frequency.
-    
+
     selection_idxs : list of int
-    A list of indexes to report.  This needs to be compatible 
+    A list of indexes to report.  This needs to be compatible
     with the elements of the system.state.q_vec vector.
 
-    returns:
-
-    (min, argmin)
+    Each report row holds two columns: (min, argmin).
     """
 
     def __init__(self, selection_idxs, freq=1):
-        self.selection_idxs = selection_idxs
+        self.selection_idxs = np.ascontiguousarray(selection_idxs,dtype=np.intp)
         super().__init__(freq=freq)
 
     def report(self,current_time,current_state_vec):
-        tmp = current_state_vec[self.selection_idxs]
-        self._reports.append({'t': current_time,
-                              'report': (np.max(tmp),np.argmax(tmp))})
+        tmp = self._gather(current_state_vec,self.selection_idxs)
+        idx = np.argmin(tmp)
+        self._record(current_time,(tmp[idx],idx))
+
+class BatchReporter(Reporter):
+    """Aggregates many selections in a single gather per report.
+
+    Registering one Sum/Avg/Max/MinReporter per quantity of interest
+    costs one fancy-index gather each per step; BatchReporter holds
+    all the selections in one flat index array and evaluates every
+    aggregate with a reduceat over a single gather.
+
+    selections : list of lists of int
+    One index list per aggregate, compatible with the elements of
+    the system.state.q_vec vector.
+
+    ops : list of str, optional
+    The aggregate to compute for each selection, one of 'sum',
+    'mean', 'max' or 'min' (default: 'sum' for every selection).
 
+    Each report row holds one entry per selection, in the order the
+    selections were given.
+    """
+
+    _OPS = ('sum','mean','max','min')
+
+    def __init__(self, selections, ops=None, freq=1):
+        super().__init__(freq=freq)
+        if ops is None:
+            ops = ['sum']*len(selections)
+        if len(ops) != len(selections):
+            raise ValueError("Error! ops must have one entry per selection")
+        for op in ops:
+            if op not in self._OPS:
+                raise ValueError("Error! op must be one of {0} ({1})".format(self._OPS,op))
+        self.ops = list(ops)
+
+        self._lens = np.array([len(s) for s in selections],dtype=np.intp)
+        self._flat = np.ascontiguousarray(
+            np.concatenate([np.asarray(s,dtype=np.intp) for s in selections]))
+        self._offsets = np.concatenate(([0],np.cumsum(self._lens)[:-1]))
+
+    def report(self,current_time,current_state_vec):
+        vals = self._gather(current_state_vec,self._flat)
+        sums = np.add.reduceat(vals,self._offsets)
+        maxs = mins = None
+
+        out = np.empty(len(self.ops))
+        for i,op in enumerate(self.ops):
+            if op == 'sum':
+                out[i] = sums[i]
+            elif op == 'mean':
+                out[i] = sums[i]/self._lens[i]
+            elif op == 'max':
+                if maxs is None:
+                    maxs = np.maximum.reduceat(vals,self._offsets)
+                out[i] = maxs[i]
+            else:
+                if mins is None:
+                    mins = np.minimum.reduceat(vals,self._offsets)
+                out[i] = mins[i]
+
+        self._record(current_time,out)
@@ -11,35 +11,79 @@ The rest of the arrays are useful for making selections:
 
 state.species is a numpy (string) array of species IDs
 state.compartment is a numpy (string) array of compartment IDs
-state.x_pos is a numpy array of x_positions of the compartment centers
-state.y_pos is a numpy array of y_positions of the compartment centers
-state.z_pos is a numpy array of z_positions of the compartment centers
+(the ID strings are interned, so the many repeats across
+compartments share one object each and elementwise == selections
+hit the string identity fast path)
+state.pos is a C-contiguous (N,3) numpy array of the compartment
+center positions; state.x_pos, state.y_pos and state.z_pos are
+zero-copy column views of it, so per-axis selections keep working
+while whole-position operations (exports, distance computations)
+can run over the single buffer
 
 Note that species values for a given compartment will only be created
 if there is either:
 1) a Reaction in that compartment which involves that Species
 or 2) a connection from that compartment which involves that Species
 
-When initializing the state, an index is constructed to easily 
+When initializing from a model, indices are assigned species-major:
+all quantities for a given species (across compartments) occupy a
+contiguous block of the state vector.  This keeps per-species
+operations (e.g. diffusion) cache-friendly.  Dataframe
+initialization sorts its rows into the same layout, and
+state.species_slices maps each species ID to the slice holding
+its block.
+
+When initializing the state, an index is constructed to easily
 determine an index given a compartment and a species:
 
 index = state.index[compID][specID]
+
+state.flat_index holds the same mapping keyed by the
+(compID, specID) tuple, resolving a quantity with one hashed
+lookup instead of two; the ID strings are interned so tuple
+hashing stays on the fast identity-comparison path.  Prefer it
+in per-quantity loops where the compartment changes every
+iteration (when it does not, hoisting the inner state.index dict
+is just as fast).
+
+For index lookups in loops, the integer table state.ids avoids
+constructing compartment-name strings (see _build_id_table).  The
+companion int32 code arrays state.spec_codes and state.comp_codes
+are the categorical form of the species/compartment arrays; bulk
+selections (where_species, species_ids) compare these instead of
+the string arrays.
 """
 
 from openrxn import unit
 from openrxn.model import FlatModel
+
+import sys
+
 import numpy as np
 import pandas as pd
 
+def _intern(s):
+    return sys.intern(s) if type(s) is str else s
+
 class State(object):
-    def __init__(self, model=None, dataframe=None, units=[unit.nanometer]*3):
-        """State objects can be initialized using either a 
-        FlatModel or a dataframe object.  At minimum, the 
-        dataframe needs to have "species" and "compartment" 
-        columns."""
+    def __init__(self, model=None, dataframe=None, units=[unit.nanometer]*3,
+                 dtype=np.float64):
+        """State objects can be initialized using either a
+        FlatModel or a dataframe object.  At minimum, the
+        dataframe needs to have "species" and "compartment"
+        columns.
+
+        dtype sets the precision of the q_val array (default
+        float64).  np.float32 halves the bytes moved through
+        snapshot/reporter paths on large states; see the
+        ODESystem dtype argument for pairing it with looser
+        solver tolerances."""
 
         self.index = {}
+        self.flat_index = {}
         self.units = units
+        self._df_template = None
+        self._snap_buf = None
         
         if model is not None: 
             assert isinstance(model,FlatModel), "Error! A state object needs a FlatModel to initialize."
@@ -50,95 +94,282 @@ class State(object):
             self._init_from_df(dataframe)        
         
         self.size = len(self.compartment)
-        self.q_val = np.zeros((self.size))
+        self.q_val = np.zeros(self.size,dtype=dtype)
+        self._build_id_table()
 
-    def _init_from_model(self, model):
-        
-        big_species_list = []
-        big_comp_list = []
-        big_x_list = []
-        big_y_list = []
-        big_z_list = []
+    def _build_id_table(self):
+        """Builds an integer lookup table for state-vector indices:
+
+        state.ids[i,j] is the index holding species j in compartment
+        i (-1 if that species is not present there), with compartment
+        rows in order of first appearance and species columns sorted.
+        state.comp_order and state.spec_order map the string IDs to
+        the row and column numbers, and state.comp_codes and
+        state.spec_codes hold those numbers per state-vector entry
+        as int32 categorical codes.
+
+        Unlike state.index, lookups through the table involve no
+        string construction, so it can be used in loops without
+        formatting compartment names (e.g. state.ids[i,A_col]
+        instead of state.index['main-{0}'.format(i)]['A']).
+        """
+
+        comps = list(dict.fromkeys(self.compartment))
+        specs = sorted(set(self.species))
+        self.comp_order = {c: i for i,c in enumerate(comps)}
+        self.spec_order = {s: j for j,s in enumerate(specs)}
+
+        # categorical form of the ID arrays: comp_codes[idx] and
+        # spec_codes[idx] are the row/column numbers of quantity idx.
+        # Selections compare these int32 arrays instead of the
+        # object-dtype string arrays (see species_ids), which runs
+        # as one vectorized integer compare
+        self.comp_codes = np.array([self.comp_order[c] for c in self.compartment],
+                                   dtype=np.int32)
+        self.spec_codes = np.array([self.spec_order[s] for s in self.species],
+                                   dtype=np.int32)
 
-        running_index = 0        
+        self.ids = np.full((len(comps),len(specs)),-1,dtype=np.int64)
+        self.ids[self.comp_codes,self.spec_codes] = np.arange(self.size)
+
+        # both construction paths store the rows species-major, so
+        # each species occupies one contiguous block; recording the
+        # blocks as slices lets per-species consumers take an O(1)
+        # contiguous view instead of a masked gather
+        starts = np.searchsorted(self.spec_codes,np.arange(len(specs)+1))
+        self.species_slices = {s: slice(int(starts[j]),int(starts[j+1]))
+                               for s,j in self.spec_order.items()}
+
+    def _compartment_centers(self, model):
+        """Returns {compartment tag: [x,y,z] center magnitudes} in
+        self.units; axes without positions are nan so the centers
+        stay in plain float arrays.
+
+        When every compartment has full 3D bounds (the usual case
+        for flattened arrays), the boundary values are converted
+        axis by axis through a single pint Quantity array instead of
+        two .to().magnitude roundtrips per axis per compartment.
+        """
+
+        comps = list(model.compartments.values())
+        if comps and all(len(c.pos) == 3 for c in comps):
+            ctr = np.empty((len(comps),3))
+            for i in range(3):
+                lo = unit.Quantity.from_list([c.pos[i][0] for c in comps])
+                hi = unit.Quantity.from_list([c.pos[i][1] for c in comps])
+                ctr[:,i] = 0.5*(lo+hi).to(self.units[i]).magnitude
+            return {tag: ctr[k] for k,tag in enumerate(model.compartments.keys())}
+
+        comp_center = {}
         for c_tag, c in model.compartments.items():
+            x = [np.nan]*3
+            for i in range(len(c.pos)):
+                x[i] = 0.5*(c.pos[i][0]+c.pos[i][1]).to(self.units[i]).magnitude
+            comp_center[c_tag] = x
+        return comp_center
 
-            self.index[c_tag] = {}
-            
-            # figure out which species are associated with this compartment
-            spec = []
+    def _init_from_model(self, model):
+
+        # the arrays and index maps built here depend only on the
+        # model, so they are cached there and shared by reference:
+        # building many states from one FlatModel (parameter sweeps,
+        # Gillespie replicates) pays the compartment scan and pint
+        # conversions once.  As with _compiled_processes, the cache
+        # goes stale if the model is modified after the first state
+        # is built.
+        cached = getattr(model,'_state_cache',None)
+        if cached is not None:
+            (self.species, self.compartment, self.pos,
+             self.index, self.flat_index) = cached
+            self.x_pos = self.pos[:,0]
+            self.y_pos = self.pos[:,1]
+            self.z_pos = self.pos[:,2]
+            return
+
+        # first pass: figure out which species are associated with
+        # each compartment
+        comp_species = {}
+        all_species = set()
+        for c_tag, c in model.compartments.items():
+            spec_set = set()
             for other_c, conn in c.connections.items():
-                spec += list(conn[1].species_rates.keys())
+                spec_set.update(conn[1].species_rates.keys())
             for rxn in c.reactions:
-                spec += rxn.reactant_IDs
-                spec += rxn.product_IDs
-            spec_set = set(spec)
+                spec_set.update(rxn.reactant_IDs)
+                spec_set.update(rxn.product_IDs)
 
-            for i,s in enumerate(spec_set):
-                self.index[c_tag][s] = running_index + i
+            comp_species[c_tag] = spec_set
+            all_species.update(spec_set)
 
-            running_index += len(spec_set)
+        comp_center = self._compartment_centers(model)
 
-            big_species_list += list(spec_set)
-            big_comp_list += [c.ID]*len(spec_set)
+        # second pass: assign indices species-major, so the block of
+        # quantities for a given species is contiguous across
+        # compartments (SoA layout); species are sorted so the layout
+        # is deterministic.  The arrays are preallocated at their
+        # final size and filled one species block at a time, instead
+        # of growing Python lists entry by entry.
+        total = sum(len(v) for v in comp_species.values())
+        self.species = np.empty(total,dtype=object)
+        self.compartment = np.empty(total,dtype=object)
+        pos = np.full((total,3),np.nan)
 
-            # for x, y and z, average the boundary values
-            x = [None,None,None]
-            for i in range(len(c.pos)):
-                x[i] = 0.5*(c.pos[i][0]+c.pos[i][1]).to(self.units[i]).magnitude
-            
-            big_x_list += [x[0]]*len(spec_set)
-            big_y_list += [x[1]]*len(spec_set)
-            big_z_list += [x[2]]*len(spec_set)
+        comp_tags = list(model.compartments.keys())
+        off = 0
+        for s in sorted(all_species):
+            s = _intern(s)
+            tags = [t for t in comp_tags if s in comp_species[t]]
+            n = len(tags)
+            if n == 0:
+                continue
+            self.species[off:off+n] = s
+            self.compartment[off:off+n] = [_intern(model.compartments[t].ID) for t in tags]
+            pos[off:off+n] = [comp_center[t] for t in tags]
+            for k,t in enumerate(tags):
+                t = _intern(t)
+                if t not in self.index:
+                    self.index[t] = {}
+                self.index[t][s] = off+k
+                self.flat_index[(t,s)] = off+k
+            off += n
+
+        self.pos = pos
+        self.x_pos = pos[:,0]
+        self.y_pos = pos[:,1]
+        self.z_pos = pos[:,2]
 
-        self.species = np.array(big_species_list)
-        self.compartment = np.array(big_comp_list)
-        self.x_pos = np.array(big_x_list)
-        self.y_pos = np.array(big_y_list)
-        self.z_pos = np.array(big_z_list)
+        model._state_cache = (self.species, self.compartment, self.pos,
+                              self.index, self.flat_index)
 
     def _init_from_df(self, df):
 
-        # assign columns to self arrays
-        self.species = np.array(df['species'])
-        self.compartment = np.array(df['compartment'])
-        if 'x_pos' in df.columns:
-            self.x_pos = np.array(df['x_pos'])
-        if 'y_pos' in df.columns:
-            self.y_pos = np.array(df['y_pos'])
-        if 'z_pos' in df.columns:
-            self.z_pos = np.array(df['z_pos'])
-
-        # building self.index dictionary
-        for i in range(len(df['species'])):
-            if df['compartment'][i] not in self.index:
-                self.index[df['compartment'][i]] = {}
-            self.index[df['compartment'][i]][df['species'][i]] = i
+        # pull the columns out of the frame once (element-by-element
+        # Series indexing goes through label lookup and dominates
+        # construction for large dataframes) and intern the IDs on
+        # the way in; dtype=object keeps the interned str objects
+        # rather than copying into a fixed-width unicode array
+        specs = [_intern(s) for s in df['species'].tolist()]
+        comps = [_intern(c) for c in df['compartment'].tolist()]
+
+        # reorder the rows species-major to match the model path, so
+        # the per-species blocks recorded in species_slices are
+        # contiguous here too; the stable sort keeps the dataframe's
+        # row order within each species.  (q_val is not taken from
+        # the dataframe, so reordering only changes the indices the
+        # index maps hand back.)
+        order = sorted(range(len(specs)),key=specs.__getitem__)
+
+        self.species = np.array([specs[i] for i in order],dtype=object)
+        self.compartment = np.array([comps[i] for i in order],dtype=object)
+
+        # position columns live as views of one (N,3) array; columns
+        # absent from the dataframe stay nan and their view attribute
+        # is not exposed, matching the previous hasattr semantics
+        pos_cols = [p for p in ('x_pos','y_pos','z_pos') if p in df.columns]
+        if pos_cols:
+            self.pos = np.full((len(comps),3),np.nan)
+            for k,p in enumerate(('x_pos','y_pos','z_pos')):
+                if p in df.columns:
+                    self.pos[:,k] = df[p].to_numpy()[order]
+                    setattr(self,p,self.pos[:,k])
+
+        # building self.index dictionary (the IDs are already
+        # interned above)
+        setdefault = self.index.setdefault
+        for i,(c_tag,s) in enumerate(zip(self.compartment,self.species)):
+            setdefault(c_tag,{})[s] = i
+            self.flat_index[(c_tag,s)] = i
+
+    def idx(self, comp_ID, spec_ID):
+        """Returns the state-vector index holding spec_ID in
+        comp_ID, resolved with a single hashed lookup (see
+        flat_index in the module docstring).  Raises KeyError if
+        that species is not present in that compartment."""
+
+        return self.flat_index[(comp_ID,spec_ID)]
+
+    def where_species(self, spec_ID):
+        """Returns the state-vector indices holding the given
+        species, in compartment order, as an integer array.
+
+        The selection compares the int32 code array rather than the
+        string array, so it costs one vectorized integer pass."""
+
+        return np.flatnonzero(self.spec_codes == self.spec_order.get(spec_ID,-1))
+
+    def where_compartment(self, comp_ID):
+        """Returns the state-vector indices belonging to the given
+        compartment, as an integer array (see where_species)."""
+
+        return np.flatnonzero(self.comp_codes == self.comp_order.get(comp_ID,-1))
+
+    def species_ids(self, spec_ID, array_ID=None):
+        """Returns the state-vector indices holding the given
+        species, in compartment order, as an integer array.  If
+        array_ID is given, only compartments that came from that
+        array (IDs of the form '{array_ID}-...') are included.
+
+        This replaces per-compartment loops over state.index with a
+        single vectorized selection.
+        """
+
+        mask = self.spec_codes == self.spec_order.get(spec_ID,-1)
+        if array_ID is not None:
+            # test the prefix once per unique compartment and fan the
+            # answers out through the code array, instead of running
+            # a string startswith per quantity
+            prefix = array_ID + '-'
+            comp_ok = np.array([c.startswith(prefix) for c in self.comp_order],
+                               dtype=bool)
+            mask &= comp_ok[self.comp_codes]
+        return np.flatnonzero(mask)
+
+    def snapshot(self):
+        """Returns a copy of q_val in a reusable scratch buffer, for
+        callers that need the values decoupled from the live state
+        (e.g. stashing a pre-perturbation vector) without paying an
+        N-float allocation per call.  The buffer is overwritten by
+        the next snapshot call; copy it if it must outlive that."""
+
+        buf = self._snap_buf
+        if buf is None or buf.shape != self.q_val.shape or buf.dtype != self.q_val.dtype:
+            buf = self._snap_buf = np.empty_like(self.q_val)
+        np.copyto(buf,self.q_val)
+        return buf
 
     def to_dataframe(self):
-        df = pd.DataFrame()
-        
-        df['species'] = self.species
-        df['compartment'] = self.compartment
-        df['q_val'] = self.q_val
-        
-        if hasattr(self,'x_pos'):
-            df['x_pos'] = self.x_pos
-        if hasattr(self,'y_pos'):
-            df['y_pos'] = self.y_pos
-        if hasattr(self,'z_pos'):
-            df['z_pos'] = self.z_pos
-        
-        return df
+        # the species/compartment/position columns never change
+        # between snapshots, so the frame is built once (a single
+        # constructor call over numpy views, rather than one setitem
+        # per column) and only q_val is rebound per call.  Clear
+        # _df_template after mutating the static arrays.
+        if self._df_template is None:
+            cols = {'species': self.species,
+                    'compartment': self.compartment,
+                    'q_val': self.q_val}
+            for k,p in enumerate(('x_pos','y_pos','z_pos')):
+                if hasattr(self,p):
+                    cols[p] = self.pos[:,k]
+            self._df_template = pd.DataFrame(cols,copy=False)
+
+        # assign replaces the existing q_val column in place, keeping
+        # the column order, and shares the other columns' buffers
+        return self._df_template.assign(q_val=self.q_val)
             
+    # index=False skips writing the meaningless row-number column
+    # (the dataframe index is just arange), chunksize batches the
+    # rows through pandas' block writer, and a fixed lineterminator
+    # avoids per-row platform newline translation
+
     def to_csv(self, filename):
         df = self.to_dataframe()
-        df.to_csv(filename)
+        df.to_csv(filename,index=False,chunksize=65536,lineterminator='\n')
 
     def to_csv_no_q(self, filename):
         df = self.to_dataframe()
 
         cols = [c for c in df.columns if c != 'q_val']
-        df.to_csv(filename,columns=cols)
+        df.to_csv(filename,columns=cols,index=False,chunksize=65536,
+                  lineterminator='\n')
         
     
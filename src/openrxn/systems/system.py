@@ -45,7 +45,7 @@ class System(object):
 
         self.model = flatmodel
         
-        if init_state != None:
+        if init_state is not None:
             self.state = init_state
         else:
             self.state = State(model=self.model)
@@ -53,6 +53,13 @@ class System(object):
         self.reporters = []
         self.reporters += reporters
 
+    def reset(self):
+        """Zeroes the state vector, so the same system (and its
+        compiled process arrays) can be reused for another
+        replicate."""
+
+        self.state.q_val[:] = 0
+
     def add_reporter(self,reporter):
         self.reporters.append(reporter)
 
@@ -73,31 +80,37 @@ class System(object):
         defined and attached to the system.
         """
 
-        report_freqs = [r.freq for r in self.reporters]
-
         # add endpoints as default, even if reporters aren't present
-        checkpoints = [0,total_time]
-        for freq in report_freqs:
-            n = int(total_time/freq) + 1
-            checkpoints += [freq*i for i in range(n)]
+        checkpoints = [np.array([0.,total_time])]
+        for r in self.reporters:
+            n = int(total_time/r.freq) + 1
+            checkpoints.append(r.freq*np.arange(n))
+        checkpoints = np.unique(np.concatenate(checkpoints))
+
+        # which reporters fire at each checkpoint is known up front,
+        # so the "is final_t a multiple of r.freq" float test is done
+        # here once per reporter over the whole schedule and turned
+        # into per-checkpoint firing lists; the loop then touches
+        # only the reporters that actually fire, instead of testing
+        # every reporter at every checkpoint
+        report_at = [[] for t in checkpoints]
+        for r in self.reporters:
+            rat = checkpoints/r.freq
+            for i in np.flatnonzero(rat - np.floor(rat) < EPSILON):
+                report_at[i].append(r)
 
-        checkpoints = list(set(checkpoints))
-        checkpoints.sort()
-        
         for i in range(len(checkpoints)-1):
             init_t = checkpoints[i]
             final_t = checkpoints[i+1]
-            
+
             result = self.propagate((init_t,final_t),**kwargs)
             if 'final_t' in result:
                 checkpoints[i+1] = result['final_t']
 
             logging.info("Reached checkpoint: t = {0}".format(checkpoints[i+1]))
-            
-            for r in self.reporters:
-                # check whether final_t is a multiple of r.freq
-                if final_t/r.freq - int(final_t/r.freq) < EPSILON:
-                    r.report(checkpoints[i+1], self.state.q_val)
+
+            for r in report_at[i+1]:
+                r.report(checkpoints[i+1], self.state.q_val)
 
         return result
         